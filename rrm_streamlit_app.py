@@ -3,20 +3,48 @@ import streamlit as st
 import pandas as pd
 import sqlite3
 from datetime import date, timedelta
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 import io
+import threading
 
 st.set_page_config(page_title="RRM Rice Mill Tracker", layout="wide")
 
 DB_PATH = "rrm_tracker.db"
 KG_PER_QTL_DEFAULT = 100
+SCHEMA_VERSION = 2  # bump when init_db() gains new DDL/seeds
 
 # ----------------- DB Helpers -----------------
+@st.cache_resource
 def get_conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    # One connection per process, reused across reruns and sessions
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None, cached_statements=256)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
 
+# Serializes writes on the shared connection
+_write_lock = threading.Lock()
+
+# Prepared statements for the transaction inserts
+INSERT_PURCHASE = """INSERT INTO purchases(dt,paddy_id,qty_qtl,qty_kg,final_qtl,rate_qtl,cost,notes)
+                     VALUES(?,?,?,?,?,?,?,?)"""
+INSERT_MILLING_INPUT = """INSERT INTO milling_input(dt,paddy_id,used_qtl,used_kg,final_used_qtl,husk_qtl,polish_qtl,expense,notes)
+                          VALUES(?,?,?,?,?,?,?,?,?)"""
+INSERT_MILLING_OUTPUT = """INSERT INTO milling_output(dt,paddy_id,grade_id,out_qtl,out_kg,final_out_qtl,notes)
+                           VALUES(?,?,?,?,?,?,?)"""
+INSERT_SALE = """INSERT INTO sales(dt,product,grade_id,qty_qtl,qty_kg,final_qtl,rate_qtl,revenue,notes)
+                 VALUES(?,?,?,?,?,?,?,?,?)"""
+
+@st.cache_resource
 def init_db():
     conn = get_conn()
     cur = conn.cursor()
+    # Established DBs skip the DDL/seed round-trips entirely
+    if cur.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
     # Config
     cur.execute("""CREATE TABLE IF NOT EXISTS config (
         key TEXT PRIMARY KEY,
@@ -78,6 +106,61 @@ def init_db():
         revenue REAL,
         notes TEXT
     )""")
+    # Indices for date rollups and master lookups
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_purchases_dt ON purchases(dt)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_milling_input_dt ON milling_input(dt)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_milling_output_dt ON milling_output(dt)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sales_dt_cover ON sales(dt, product, revenue, final_qtl)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_purchases_paddy ON purchases(paddy_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_milling_input_paddy ON milling_input(paddy_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_milling_output_paddy ON milling_output(paddy_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_milling_output_grade ON milling_output(grade_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sales_grade ON sales(grade_id)")
+    # Daily summary, maintained incrementally by insert triggers
+    cur.execute("""CREATE TABLE IF NOT EXISTS daily_summary (
+        dt TEXT PRIMARY KEY,
+        paddy_in REAL DEFAULT 0,
+        paddy_used REAL DEFAULT 0,
+        rice_out REAL DEFAULT 0,
+        rice_sold REAL DEFAULT 0,
+        revenue REAL DEFAULT 0
+    )""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS trg_purchases_ai AFTER INSERT ON purchases
+        WHEN NEW.dt IS NOT NULL AND NEW.dt<>'' BEGIN
+        INSERT INTO daily_summary(dt,paddy_in) VALUES(NEW.dt, COALESCE(NEW.final_qtl,0))
+        ON CONFLICT(dt) DO UPDATE SET paddy_in = paddy_in + excluded.paddy_in;
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS trg_milling_input_ai AFTER INSERT ON milling_input
+        WHEN NEW.dt IS NOT NULL AND NEW.dt<>'' BEGIN
+        INSERT INTO daily_summary(dt,paddy_used) VALUES(NEW.dt, COALESCE(NEW.final_used_qtl,0))
+        ON CONFLICT(dt) DO UPDATE SET paddy_used = paddy_used + excluded.paddy_used;
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS trg_milling_output_ai AFTER INSERT ON milling_output
+        WHEN NEW.dt IS NOT NULL AND NEW.dt<>'' BEGIN
+        INSERT INTO daily_summary(dt,rice_out) VALUES(NEW.dt, COALESCE(NEW.final_out_qtl,0))
+        ON CONFLICT(dt) DO UPDATE SET rice_out = rice_out + excluded.rice_out;
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS trg_sales_ai AFTER INSERT ON sales
+        WHEN NEW.dt IS NOT NULL AND NEW.dt<>'' BEGIN
+        INSERT INTO daily_summary(dt,rice_sold,revenue)
+        VALUES(NEW.dt, CASE WHEN NEW.product='Rice' THEN COALESCE(NEW.final_qtl,0) ELSE 0 END, COALESCE(NEW.revenue,0))
+        ON CONFLICT(dt) DO UPDATE SET rice_sold = rice_sold + excluded.rice_sold, revenue = revenue + excluded.revenue;
+    END""")
+    # Rebuild from the base tables so rows written before the triggers existed are counted
+    cur.execute("DELETE FROM daily_summary")
+    cur.execute("""INSERT INTO daily_summary(dt,paddy_in,paddy_used,rice_out,rice_sold,revenue)
+        SELECT dt, SUM(paddy_in), SUM(paddy_used), SUM(rice_out), SUM(rice_sold), SUM(rev)
+        FROM (
+            SELECT dt, COALESCE(final_qtl,0) AS paddy_in, 0 AS paddy_used, 0 AS rice_out, 0 AS rice_sold, 0 AS rev FROM purchases
+            UNION ALL
+            SELECT dt, 0, COALESCE(final_used_qtl,0), 0, 0, 0 FROM milling_input
+            UNION ALL
+            SELECT dt, 0, 0, COALESCE(final_out_qtl,0), 0, 0 FROM milling_output
+            UNION ALL
+            SELECT dt, 0, 0, 0, CASE WHEN product='Rice' THEN COALESCE(final_qtl,0) ELSE 0 END, COALESCE(revenue,0) FROM sales
+        ) s
+        WHERE dt IS NOT NULL AND dt<>''
+        GROUP BY dt""")
     conn.commit()
     # Seed config
     cur.execute("INSERT OR IGNORE INTO config(key,value) VALUES('kg_per_qtl',?)", (str(KG_PER_QTL_DEFAULT),))
@@ -89,28 +172,36 @@ def init_db():
         ('GRD-MDUB','Mini Dubar',0),('GRD-SMOG','Super Mogara',0),('GRD-MOG','Mogara',0),
         ('GRD-MMOG','Mini Mogara',0)
     """)
+    cur.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
     conn.commit()
-    conn.close()
 
 def get_cfg(key, default=None):
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT value FROM config WHERE key=?", (key,))
-        r = cur.fetchone()
-        return r[0] if r else default
+    cur = get_conn().cursor()
+    cur.execute("SELECT value FROM config WHERE key=?", (key,))
+    r = cur.fetchone()
+    return r[0] if r else default
 
 def set_cfg(key, value):
-    with get_conn() as conn:
-        conn.execute("INSERT OR REPLACE INTO config(key,value) VALUES(?,?)", (key, str(value)))
+    with _write_lock:
+        get_conn().execute("INSERT OR REPLACE INTO config(key,value) VALUES(?,?)", (key, str(value)))
 
 def df_read(sql, params=()):
-    with get_conn() as conn:
-        return pd.read_sql_query(sql, conn, params=params)
+    # Arrow-backed columns go to st.dataframe without a NumPy->Arrow conversion
+    return pd.read_sql_query(sql, get_conn(), params=params, dtype_backend="pyarrow")
+
+@st.cache_data(ttl=300)
+def cached_read(sql, params=()):
+    # Read-mostly queries; invalidated by exec_sql on every write
+    return df_read(sql, params)
 
 def exec_sql(sql, params=()):
-    with get_conn() as conn:
-        conn.execute(sql, params)
-        conn.commit()
+    # params: one tuple, or a list of tuples to run as a single batched transaction
+    rows = params if isinstance(params, list) else [params]
+    conn = get_conn()
+    with _write_lock, conn:
+        conn.execute("BEGIN")
+        conn.executemany(sql, rows)
+    cached_read.clear()
 
 # Initialize
 init_db()
@@ -120,19 +211,25 @@ st.title("Rajendra Rice & General Mills — Rice Mill Tracker")
 # Sidebar
 st.sidebar.header("Settings & Data")
 kg_per_qtl = st.sidebar.number_input("KG per Quintal", min_value=1, max_value=200, value=int(get_cfg("kg_per_qtl", KG_PER_QTL_DEFAULT)))
+st.session_state["kg_per_qtl"] = kg_per_qtl
 if st.sidebar.button("Save Conversion"):
     set_cfg("kg_per_qtl", kg_per_qtl)
     st.sidebar.success("Saved")
+days_to_show = st.sidebar.number_input("Days to show", min_value=1, value=60, step=30)
+days_offset = st.sidebar.number_input("Days to skip", min_value=0, value=0, step=60)
 
 # Tabs
 tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Dashboard","Masters","Purchases","Milling Input","Milling Output","Sales"])
 
 # -------- Dashboard --------
-with tab1:
+@st.fragment(run_every="30s")
+def dashboard_tab():
     colA, colB, colC = st.columns([1,1,1])
-    sales_rev = df_read("SELECT COALESCE(SUM(revenue),0) AS r FROM sales")["r"][0]
-    pur_cost = df_read("SELECT COALESCE(SUM(cost),0) AS c FROM purchases")["c"][0]
-    mil_exp = df_read("SELECT COALESCE(SUM(expense),0) AS e FROM milling_input")["e"][0]
+    kpi = cached_read("""SELECT (SELECT COALESCE(SUM(revenue),0) FROM sales) AS r,
+                                 (SELECT COALESCE(SUM(cost),0) FROM purchases) AS c,
+                                 (SELECT COALESCE(SUM(expense),0) FROM milling_input) AS e""")
+    row = kpi.iloc[0]
+    sales_rev, pur_cost, mil_exp = row["r"], row["c"], row["e"]
     gross_profit = sales_rev - pur_cost - mil_exp
 
     colA.metric("Sales Revenue (₹)", f"{sales_rev:,.0f}")
@@ -141,30 +238,29 @@ with tab1:
 
     # Daily summary
     st.subheader("Daily Summary")
-    daily = df_read("""
+    daily = cached_read("""
         SELECT dt as Date,
-               COALESCE((SELECT SUM(final_qtl) FROM purchases p WHERE p.dt = s.dt),0) AS Paddy_IN_qtl,
-               COALESCE((SELECT SUM(final_used_qtl) FROM milling_input mi WHERE mi.dt = s.dt),0) AS Paddy_USED_qtl,
-               COALESCE((SELECT SUM(final_out_qtl) FROM milling_output mo WHERE mo.dt = s.dt),0) AS Rice_OUT_qtl,
-               COALESCE((SELECT SUM(final_qtl) FROM sales sa WHERE sa.dt = s.dt AND product='Rice'),0) AS Rice_Sold_qtl,
-               COALESCE((SELECT SUM(revenue) FROM sales sa WHERE sa.dt = s.dt),0) AS Sales_Revenue
-        FROM (
-            SELECT dt FROM purchases
-            UNION
-            SELECT dt FROM milling_input
-            UNION
-            SELECT dt FROM milling_output
-            UNION
-            SELECT dt FROM sales
-        ) s
-        WHERE dt IS NOT NULL AND dt<>''
-        GROUP BY dt
+               paddy_in AS Paddy_IN_qtl,
+               paddy_used AS Paddy_USED_qtl,
+               rice_out AS Rice_OUT_qtl,
+               rice_sold AS Rice_Sold_qtl,
+               revenue AS Sales_Revenue
+        FROM daily_summary
         ORDER BY dt DESC
-    """)
+        LIMIT ? OFFSET ?
+    """, (int(days_to_show), int(days_offset)))
     st.dataframe(daily, use_container_width=True)
 
+with tab1:
+    dashboard_tab()
+
 # -------- Masters --------
-with tab2:
+@st.fragment
+def masters_tab():
+    # Writes here change the lists other tabs read, so they rerun the whole app;
+    # the confirmation is carried across that rerun in session_state
+    if "masters_msg" in st.session_state:
+        st.success(st.session_state.pop("masters_msg"))
     st.subheader("Paddy Types")
     paddy = df_read("SELECT paddy_id AS ID, paddy_name AS Name FROM paddy_types ORDER BY Name")
     st.dataframe(paddy, use_container_width=True)
@@ -177,7 +273,7 @@ with tab2:
                 if pid and pname:
                     try:
                         exec_sql("INSERT INTO paddy_types(paddy_id,paddy_name) VALUES(?,?)", (pid, pname))
-                        st.success("Added")
+                        st.session_state["masters_msg"] = "Added"; st.rerun()
                     except Exception as e:
                         st.error(f"Error: {e}")
         else:
@@ -187,7 +283,7 @@ with tab2:
                 if st.button("Rename"):
                     try:
                         exec_sql("UPDATE paddy_types SET paddy_name=? WHERE paddy_id=?", (new_name, old))
-                        st.success("Renamed")
+                        st.session_state["masters_msg"] = "Renamed"; st.rerun()
                     except Exception as e:
                         st.error(f"Error: {e}")
 
@@ -205,7 +301,7 @@ with tab2:
                 if gid and gname:
                     try:
                         exec_sql("INSERT INTO rice_grades(grade_id,grade_name,default_price_qtl) VALUES(?,?,0)", (gid, gname))
-                        st.success("Added")
+                        st.session_state["masters_msg"] = "Added"; st.rerun()
                     except Exception as e:
                         st.error(f"Error: {e}")
         else:
@@ -215,42 +311,52 @@ with tab2:
                 if st.button("Update Price"):
                     try:
                         exec_sql("UPDATE rice_grades SET default_price_qtl=? WHERE grade_id=?", (new_price, gid_sel))
-                        st.success("Updated")
+                        st.session_state["masters_msg"] = "Updated"; st.rerun()
                     except Exception as e:
                         st.error(f"Error: {e}")
 
+with tab2:
+    masters_tab()
+
 # -------- Purchases --------
-with tab3:
+@st.fragment
+def purchases_tab():
     st.subheader("Record Purchase")
-    paddy_df = df_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
+    paddy_df = cached_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
+    paddy_map = dict(zip(paddy_df["paddy_id"], paddy_df["paddy_name"]))
     c1, c2, c3 = st.columns(3)
     dt = c1.date_input("Date", value=date.today())
-    paddy_sel = c2.selectbox("Paddy Type", options=paddy_df["paddy_id"], format_func=lambda x: paddy_df.set_index("paddy_id").loc[x,"paddy_name"] if not paddy_df.empty else x)
+    paddy_sel = c2.selectbox("Paddy Type", options=paddy_df["paddy_id"], format_func=lambda x: paddy_map.get(x, x))
     rate = c3.number_input("Rate (₹/qtl)", min_value=0.0, step=50.0)
     c4, c5, c6 = st.columns(3)
     qty_qtl = c4.number_input("Qty IN (qtl)", min_value=0.0, step=0.1)
     qty_kg = c5.number_input("Qty IN (kg)", min_value=0.0, step=10.0)
     notes = c6.text_input("Notes")
     if st.button("Add Purchase"):
-        final_qtl = qty_qtl if qty_qtl>0 else (qty_kg/float(get_cfg("kg_per_qtl", KG_PER_QTL_DEFAULT)) if qty_kg>0 else 0)
+        final_qtl = qty_qtl if qty_qtl>0 else (qty_kg/st.session_state["kg_per_qtl"] if qty_kg>0 else 0)
         cost = final_qtl * rate if (final_qtl and rate) else 0
-        exec_sql("""INSERT INTO purchases(dt,paddy_id,qty_qtl,qty_kg,final_qtl,rate_qtl,cost,notes)
-                    VALUES(?,?,?,?,?,?,?,?)""",
+        exec_sql(INSERT_PURCHASE,
                  (dt.isoformat(), paddy_sel, qty_qtl, qty_kg, final_qtl, rate, cost, notes))
         st.success("Saved")
 
     st.markdown("### Recent Purchases")
+    show_n = st.selectbox("Show", [50, 200, 1000], index=1, key="pur_show")
     st.dataframe(df_read("""SELECT p.dt as Date, t.paddy_name as Paddy, p.final_qtl as Final_qtl, p.rate_qtl as Rate, p.cost as Cost, p.notes as Notes
-                             FROM purchases p LEFT JOIN paddy_types t ON p.paddy_id=t.paddy_id ORDER BY p.id DESC LIMIT 200"""),
+                             FROM purchases p LEFT JOIN paddy_types t ON p.paddy_id=t.paddy_id ORDER BY p.id DESC LIMIT ?""", (show_n,)),
                  use_container_width=True)
 
+with tab3:
+    purchases_tab()
+
 # -------- Milling Input --------
-with tab4:
+@st.fragment
+def milling_input_tab():
     st.subheader("Record Milling Input")
-    paddy_df = df_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
+    paddy_df = cached_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
+    paddy_map = dict(zip(paddy_df["paddy_id"], paddy_df["paddy_name"]))
     c1, c2, c3 = st.columns(3)
     dt = c1.date_input("Date ", value=date.today(), key="mi_date")
-    paddy_sel = c2.selectbox("Paddy Type ", options=paddy_df["paddy_id"], format_func=lambda x: paddy_df.set_index("paddy_id").loc[x,"paddy_name"] if not paddy_df.empty else x, key="mi_paddy")
+    paddy_sel = c2.selectbox("Paddy Type ", options=paddy_df["paddy_id"], format_func=lambda x: paddy_map.get(x, x), key="mi_paddy")
     expense = c3.number_input("Milling Expense (₹)", min_value=0.0, step=100.0)
     c4, c5, c6 = st.columns(3)
     used_qtl = c4.number_input("Paddy Used (qtl)", min_value=0.0, step=0.1)
@@ -260,93 +366,122 @@ with tab4:
     husk = c7.number_input("Husk Out (qtl)", min_value=0.0, step=0.1)
     polish = c8.number_input("Polish Out (qtl)", min_value=0.0, step=0.1)
     if st.button("Add Milling Input"):
-        final_used_qtl = used_qtl if used_qtl>0 else (used_kg/float(get_cfg("kg_per_qtl", KG_PER_QTL_DEFAULT)) if used_kg>0 else 0)
-        exec_sql("""INSERT INTO milling_input(dt,paddy_id,used_qtl,used_kg,final_used_qtl,husk_qtl,polish_qtl,expense,notes)
-                    VALUES(?,?,?,?,?,?,?,?,?)""",
+        final_used_qtl = used_qtl if used_qtl>0 else (used_kg/st.session_state["kg_per_qtl"] if used_kg>0 else 0)
+        exec_sql(INSERT_MILLING_INPUT,
                  (dt.isoformat(), paddy_sel, used_qtl, used_kg, final_used_qtl, husk, polish, expense, notes))
         st.success("Saved")
 
     st.markdown("### Recent Milling Inputs")
+    show_n = st.selectbox("Show", [50, 200, 1000], index=1, key="mi_show")
     st.dataframe(df_read("""SELECT mi.dt as Date, t.paddy_name as Paddy, mi.final_used_qtl as Used_qtl, mi.husk_qtl as Husk, mi.polish_qtl as Polish, mi.expense as Expense
-                             FROM milling_input mi LEFT JOIN paddy_types t ON mi.paddy_id=t.paddy_id ORDER BY mi.id DESC LIMIT 200"""),
+                             FROM milling_input mi LEFT JOIN paddy_types t ON mi.paddy_id=t.paddy_id ORDER BY mi.id DESC LIMIT ?""", (show_n,)),
                  use_container_width=True)
 
+with tab4:
+    milling_input_tab()
+
 # -------- Milling Output --------
-with tab5:
+@st.fragment
+def milling_output_tab():
     st.subheader("Record Milling Output (ANY Paddy x ANY Grade)")
-    paddy_df = df_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
-    grade_df = df_read("SELECT grade_id, grade_name, default_price_qtl FROM rice_grades ORDER BY grade_name")
+    paddy_df = cached_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
+    paddy_map = dict(zip(paddy_df["paddy_id"], paddy_df["paddy_name"]))
+    grade_df = cached_read("SELECT grade_id, grade_name, default_price_qtl FROM rice_grades ORDER BY grade_name")
+    grade_map = dict(zip(grade_df["grade_id"], grade_df["grade_name"]))
     c1, c2, c3 = st.columns(3)
     dt = c1.date_input("Date  ", value=date.today(), key="mo_date")
-    paddy_sel = c2.selectbox("Paddy Type  ", options=paddy_df["paddy_id"], format_func=lambda x: paddy_df.set_index("paddy_id").loc[x,"paddy_name"] if not paddy_df.empty else x)
-    grade_sel = c3.selectbox("Rice Grade / Cut", options=grade_df["grade_id"], format_func=lambda x: grade_df.set_index("grade_id").loc[x,"grade_name"] if not grade_df.empty else x)
+    paddy_sel = c2.selectbox("Paddy Type  ", options=paddy_df["paddy_id"], format_func=lambda x: paddy_map.get(x, x))
+    grade_sel = c3.selectbox("Rice Grade / Cut", options=grade_df["grade_id"], format_func=lambda x: grade_map.get(x, x))
     c4, c5 = st.columns(2)
     out_qtl = c4.number_input("Rice OUT (qtl)", min_value=0.0, step=0.1)
     out_kg  = c5.number_input("Rice OUT (kg)", min_value=0.0, step=10.0)
     notes = st.text_input("Notes  ", key="mo_notes")
     if st.button("Add Milling Output"):
-        final_out_qtl = out_qtl if out_qtl>0 else (out_kg/float(get_cfg("kg_per_qtl", KG_PER_QTL_DEFAULT)) if out_kg>0 else 0)
-        exec_sql("""INSERT INTO milling_output(dt,paddy_id,grade_id,out_qtl,out_kg,final_out_qtl,notes)
-                    VALUES(?,?,?,?,?,?,?)""",
+        final_out_qtl = out_qtl if out_qtl>0 else (out_kg/st.session_state["kg_per_qtl"] if out_kg>0 else 0)
+        exec_sql(INSERT_MILLING_OUTPUT,
                  (dt.isoformat(), paddy_sel, grade_sel, out_qtl, out_kg, final_out_qtl, notes))
         st.success("Saved")
 
     st.markdown("### Recent Milling Outputs")
+    show_n = st.selectbox("Show", [50, 200, 1000], index=1, key="mo_show")
     st.dataframe(df_read("""SELECT mo.dt as Date, t.paddy_name as Paddy, g.grade_name as Grade, mo.final_out_qtl as Out_qtl, mo.notes as Notes
                              FROM milling_output mo
                              LEFT JOIN paddy_types t ON mo.paddy_id=t.paddy_id
                              LEFT JOIN rice_grades g ON mo.grade_id=g.grade_id
-                             ORDER BY mo.id DESC LIMIT 200"""),
+                             ORDER BY mo.id DESC LIMIT ?""", (show_n,)),
                  use_container_width=True)
 
+with tab5:
+    milling_output_tab()
+
 # -------- Sales --------
-with tab6:
+@st.fragment
+def sales_tab():
     st.subheader("Record Sales")
-    grade_df = df_read("SELECT grade_id, grade_name, default_price_qtl FROM rice_grades ORDER BY grade_name")
+    grade_df = cached_read("SELECT grade_id, grade_name, default_price_qtl FROM rice_grades ORDER BY grade_name")
+    grade_map = dict(zip(grade_df["grade_id"], grade_df["grade_name"]))
+    grade_price_map = dict(zip(grade_df["grade_id"], grade_df["default_price_qtl"].fillna(0.0).astype(float)))
     c1, c2, c3 = st.columns(3)
     dt = c1.date_input("Date   ", value=date.today(), key="sa_date")
     product = c2.selectbox("Product", options=["Rice","Husk","Polish"])
-    grade_sel = c3.selectbox("Rice Grade (if Rice)", options=[""] + grade_df["grade_id"].tolist(), index=0, format_func=lambda x: (grade_df.set_index("grade_id").loc[x,"grade_name"] if x and not grade_df.empty else ""))
+    grade_sel = c3.selectbox("Rice Grade (if Rice)", options=[""] + grade_df["grade_id"].tolist(), index=0, format_func=lambda x: (grade_map.get(x, x) if x else ""))
     c4, c5, c6 = st.columns(3)
     qty_qtl = c4.number_input("Qty OUT (qtl)", min_value=0.0, step=0.1)
     qty_kg  = c5.number_input("Qty OUT (kg)", min_value=0.0, step=10.0)
-    default_rate = 0.0
-    if product=="Rice" and grade_sel:
-        try:
-            default_rate = float(grade_df.set_index("grade_id").loc[grade_sel,"default_price_qtl"] or 0.0)
-        except:
-            default_rate = 0.0
+    default_rate = grade_price_map.get(grade_sel, 0.0) if product=="Rice" else 0.0
     rate = c6.number_input("Rate (₹/qtl)", min_value=0.0, step=50.0, value=default_rate)
     notes = st.text_input("Notes    ", key="sa_notes")
     if st.button("Add Sale"):
-        final_qtl = qty_qtl if qty_qtl>0 else (qty_kg/float(get_cfg("kg_per_qtl", KG_PER_QTL_DEFAULT)) if qty_kg>0 else 0)
+        final_qtl = qty_qtl if qty_qtl>0 else (qty_kg/st.session_state["kg_per_qtl"] if qty_kg>0 else 0)
         revenue = final_qtl * rate if (final_qtl and rate) else 0
-        exec_sql("""INSERT INTO sales(dt,product,grade_id,qty_qtl,qty_kg,final_qtl,rate_qtl,revenue,notes)
-                    VALUES(?,?,?,?,?,?,?,?,?)""",
+        exec_sql(INSERT_SALE,
                  (dt.isoformat(), product, grade_sel if product=="Rice" else None,
                   qty_qtl, qty_kg, final_qtl, rate, revenue, notes))
         st.success("Saved")
 
     st.markdown("### Recent Sales")
+    show_n = st.selectbox("Show", [50, 200, 1000], index=1, key="sa_show")
     st.dataframe(df_read("""SELECT s.dt as Date, s.product as Product, g.grade_name as Grade, s.final_qtl as Qty_qtl, s.rate_qtl as Rate, s.revenue as Revenue, s.notes as Notes
                              FROM sales s LEFT JOIN rice_grades g ON s.grade_id=g.grade_id
-                             ORDER BY s.id DESC LIMIT 200"""),
+                             ORDER BY s.id DESC LIMIT ?""", (show_n,)),
                  use_container_width=True)
 
+with tab6:
+    sales_tab()
+
 # -------- Export / Import --------
 st.sidebar.markdown("---")
 st.sidebar.subheader("Export / Import")
+EXPORT_SHEETS = [
+    ("paddy_types", "Master_PaddyTypes"),
+    ("rice_grades", "Master_RiceGrades"),
+    ("purchases", "Purchases"),
+    ("milling_input", "Milling_Input"),
+    ("milling_output", "Milling_Output"),
+    ("sales", "Sales"),
+]
+
+def read_table_ro(table):
+    # Private read-only connection so workers can read in parallel under WAL
+    with closing(sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)) as conn:
+        return pd.read_sql_query(f"SELECT * FROM {table}", conn)
+
+@st.cache_data(ttl=60)
+def build_excel_bytes(version):
+    # version: total_changes of the shared connection, so any write busts the cache
+    tables = [t for t, _ in EXPORT_SHEETS]
+    workers = len(tables) if sqlite3.threadsafety else 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        frames = list(pool.map(read_table_ro, tables))
+    xls = io.BytesIO()
+    # xlsxwriter is not thread-safe, so sheets are written sequentially
+    with pd.ExcelWriter(xls, engine="xlsxwriter") as writer:
+        for (_, sheet), df in zip(EXPORT_SHEETS, frames):
+            df.to_excel(writer, sheet_name=sheet, index=False)
+    return xls.getvalue()
+
 if st.sidebar.button("Export to Excel (.xlsx)"):
     # Build multi-sheet Excel in memory
-    with get_conn() as conn:
-        xls = io.BytesIO()
-        with pd.ExcelWriter(xls, engine="xlsxwriter") as writer:
-            pd.read_sql_query("SELECT * FROM paddy_types", conn).to_excel(writer, sheet_name="Master_PaddyTypes", index=False)
-            pd.read_sql_query("SELECT * FROM rice_grades", conn).to_excel(writer, sheet_name="Master_RiceGrades", index=False)
-            pd.read_sql_query("SELECT * FROM purchases", conn).to_excel(writer, sheet_name="Purchases", index=False)
-            pd.read_sql_query("SELECT * FROM milling_input", conn).to_excel(writer, sheet_name="Milling_Input", index=False)
-            pd.read_sql_query("SELECT * FROM milling_output", conn).to_excel(writer, sheet_name="Milling_Output", index=False)
-            pd.read_sql_query("SELECT * FROM sales", conn).to_excel(writer, sheet_name="Sales", index=False)
-        st.sidebar.download_button("Download data.xlsx", xls.getvalue(), file_name="RRM_Mill_Data.xlsx")
+    st.sidebar.download_button("Download data.xlsx", build_excel_bytes(get_conn().total_changes), file_name="RRM_Mill_Data.xlsx")
 
 st.sidebar.caption("Tip: Deploy this app on Streamlit Cloud or a small VPS. The SQLite DB file (rrm_tracker.db) stays on the server for persistence.")
@@ -2,8 +2,9 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
-from datetime import date, datetime
-import io, os
+from datetime import date, timedelta
+from functools import reduce
+import io, os, threading
 
 st.set_page_config(page_title="RRM Rice Mill Tracker", layout="wide")
 
@@ -14,13 +15,35 @@ DB_PATH = os.path.join(DATA_DIR, "rrm_tracker.db")
 
 KG_PER_QTL_DEFAULT = 100
 
+SEED_PADDY = [("PAD-1121","1121"),("PAD-1509","1509"),("PAD-PR14","PR-14")]
+SEED_GRADES = [
+    ("GRD-WAND","Wand"),("GRD-S2ND","Super 2nd Wand"),("GRD-2ND","2nd Wand"),
+    ("GRD-TIBAR","Tibar"),("GRD-SDUB","Super Dubar"),("GRD-DUB","Dubar"),
+    ("GRD-MDUB","Mini Dubar"),("GRD-SMOG","Super Mogara"),("GRD-MOG","Mogara"),
+    ("GRD-MMOG","Mini Mogara"),
+]
+
 # ----------------- DB Helpers -----------------
+@st.cache_resource
 def get_conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    # One long-lived connection shared by every rerun and session
+    c = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+    # Per-connection settings (journal_mode is persisted in the file by init_db)
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA cache_size=-20000")
+    c.execute("PRAGMA temp_store=MEMORY")
+    c.execute("PRAGMA mmap_size=134217728")
+    return c
+
+@st.cache_resource
+def get_write_lock():
+    return threading.Lock()
 
 def init_db():
     conn = get_conn()
     cur = conn.cursor()
+    # WAL lets dashboard reads run while a write is in progress
+    cur.execute("PRAGMA journal_mode=WAL")
     # Config
     cur.execute("""CREATE TABLE IF NOT EXISTS config (
         key TEXT PRIMARY KEY,
@@ -82,47 +105,118 @@ def init_db():
         revenue REAL,
         notes TEXT
     )""")
+    # Indexes for date filters and paddy/grade joins
+    for stmt in [
+        "CREATE INDEX IF NOT EXISTS ix_pur_dt ON purchases(dt)",
+        "CREATE INDEX IF NOT EXISTS ix_mi_dt ON milling_input(dt)",
+        "CREATE INDEX IF NOT EXISTS ix_mo_dt ON milling_output(dt)",
+        "CREATE INDEX IF NOT EXISTS ix_sa_dt ON sales(dt)",
+        "CREATE INDEX IF NOT EXISTS ix_pur_pid ON purchases(paddy_id)",
+        "CREATE INDEX IF NOT EXISTS ix_mi_pid ON milling_input(paddy_id)",
+        "CREATE INDEX IF NOT EXISTS ix_mo_gid ON milling_output(grade_id)",
+        "CREATE INDEX IF NOT EXISTS ix_sa_gid ON sales(grade_id)",
+    ]:
+        cur.execute(stmt)
     conn.commit()
-    # Seed basic data
-    cur.execute("INSERT OR IGNORE INTO config(key,value) VALUES('kg_per_qtl',?)", (str(KG_PER_QTL_DEFAULT),))
-    cur.execute("INSERT OR IGNORE INTO paddy_types(paddy_id,paddy_name) VALUES('PAD-1121','1121'),('PAD-1509','1509'),('PAD-PR14','PR-14')")
-    cur.execute("""INSERT OR IGNORE INTO rice_grades(grade_id,grade_name,default_price_qtl) VALUES
-        ('GRD-WAND','Wand',0),('GRD-S2ND','Super 2nd Wand',0),('GRD-2ND','2nd Wand',0),
-        ('GRD-TIBAR','Tibar',0),('GRD-SDUB','Super Dubar',0),('GRD-DUB','Dubar',0),
-        ('GRD-MDUB','Mini Dubar',0),('GRD-SMOG','Super Mogara',0),('GRD-MOG','Mogara',0),
-        ('GRD-MMOG','Mini Mogara',0)
-    """)
-    conn.commit()
-    conn.close()
+    # Seed basic data in a single transaction
+    with conn:
+        cur.execute("BEGIN")
+        cur.execute("INSERT OR IGNORE INTO config(key,value) VALUES('kg_per_qtl',?)", (str(KG_PER_QTL_DEFAULT),))
+        cur.executemany("INSERT OR IGNORE INTO paddy_types(paddy_id,paddy_name) VALUES(?,?)", SEED_PADDY)
+        cur.executemany("INSERT OR IGNORE INTO rice_grades(grade_id,grade_name,default_price_qtl) VALUES(?,?,0)", SEED_GRADES)
 
 def get_cfg(key, default=None):
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT value FROM config WHERE key=?", (key,))
-        r = cur.fetchone()
-        return r[0] if r else default
+    cur = get_conn().cursor()
+    cur.execute("SELECT value FROM config WHERE key=?", (key,))
+    r = cur.fetchone()
+    return r[0] if r else default
 
 def set_cfg(key, value):
-    with get_conn() as conn:
-        conn.execute("INSERT OR REPLACE INTO config(key,value) VALUES(?,?)", (key, str(value)))
+    with get_write_lock():
+        get_conn().execute("INSERT OR REPLACE INTO config(key,value) VALUES(?,?)", (key, str(value)))
+
+def db_version():
+    # Cache key: total_changes counts this connection's writes; data_version moves when
+    # another connection (e.g. the other app on the same DB file) commits
+    conn = get_conn()
+    return conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _df_read(sql, params, version):
+    return pd.read_sql_query(sql, get_conn(), params=params, dtype_backend="pyarrow")
 
 def df_read(sql, params=()):
-    with get_conn() as conn:
-        return pd.read_sql_query(sql, conn, params=params)
+    return _df_read(sql, tuple(params), db_version())
+
+def clear_read_caches():
+    # Only this app's DB-backed caches, not every st.cache_data function in the process
+    for fn in (_df_read, dashboard_totals, daily_yield, build_export):
+        fn.clear()
 
 def exec_sql(sql, params=()):
-    with get_conn() as conn:
-        conn.execute(sql, params)
-        conn.commit()
+    with get_write_lock():
+        get_conn().execute(sql, params)
+    clear_read_caches()
 
-def to_date(s):
-    try:
-        return datetime.strptime(s, "%Y-%m-%d").date()
-    except:
-        return None
+def bulk_insert(table, cols, rows):
+    # One transaction for an iterable of row tuples (e.g. CSV imports)
+    sql = f"INSERT INTO {table}({','.join(cols)}) VALUES({','.join('?' * len(cols))})"
+    conn = get_conn()
+    with get_write_lock(), conn:
+        conn.execute("BEGIN")
+        conn.executemany(sql, rows)
+    clear_read_caches()
+
+def scalar(sql, params=()):
+    # Single-value reads skip the DataFrame round trip
+    cur = get_conn().cursor()
+    return cur.execute(sql, params).fetchone()[0]
+
+def fetch_row(sql, params=()):
+    # One record as a sqlite3.Row; NULLs stay None rather than pd.NA
+    cur = get_conn().cursor()
+    cur.row_factory = sqlite3.Row
+    return cur.execute(sql, params).fetchone()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def dashboard_totals(version):
+    return {"sales_rev": scalar("SELECT COALESCE(SUM(revenue),0) FROM sales"),
+            "pur_cost":  scalar("SELECT COALESCE(SUM(cost),0) FROM purchases"),
+            "mil_exp":   scalar("SELECT COALESCE(SUM(expense),0) FROM milling_input")}
+
+def load_paddy_types():
+    return df_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
+
+def load_grades():
+    return df_read("SELECT grade_id, grade_name, default_price_qtl FROM rice_grades ORDER BY grade_name")
+
+@st.cache_data(ttl=300, show_spinner=False)
+def daily_yield(version):
+    # Daily yield using pandas (avoids SQL UNION issues)
+    mi_df = df_read("SELECT dt, final_used_qtl FROM milling_input").copy()
+    mo_df = df_read("SELECT dt, final_out_qtl FROM milling_output").copy()
+    # Keep dates as datetime64 so groupby runs on int64 rather than date objects
+    mi_df["dt"] = pd.to_datetime(mi_df["dt"], format="%Y-%m-%d", errors="coerce").dt.floor("D")
+    mi_df["final_used_qtl"] = pd.to_numeric(mi_df["final_used_qtl"], errors="coerce")
+    mo_df["dt"] = pd.to_datetime(mo_df["dt"], format="%Y-%m-%d", errors="coerce").dt.floor("D")
+    mo_df["final_out_qtl"] = pd.to_numeric(mo_df["final_out_qtl"], errors="coerce")
+    # Group by date
+    mi_g = mi_df.groupby("dt", dropna=True)["final_used_qtl"].sum().rename("Paddy_Used_qtl")
+    mo_g = mo_df.groupby("dt", dropna=True)["final_out_qtl"].sum().rename("Rice_Out_qtl")
+    dy = pd.concat([mi_g, mo_g], axis=1).fillna(0.0).reset_index().rename(columns={"dt":"Date"})
+    if not dy.empty:
+        dy["Yield_%"] = (dy["Rice_Out_qtl"] * 100.0 / dy["Paddy_Used_qtl"].replace({0: pd.NA})).round(2)
+        dy = dy.sort_values("Date", ascending=False)
+        dy["Date"] = dy["Date"].dt.date  # display only
+    return dy
+
+# Initialize (once per process, not on every rerun)
+@st.cache_resource
+def _init_db_once():
+    init_db()
+    return True
 
-# Initialize
-init_db()
+_init_db_once()
 
 st.title("🌾 Rajendra Rice & General Mills — Rice Mill Tracker (Cloud)")
 
@@ -135,13 +229,32 @@ if st.sidebar.button("Save Conversion"):
 
 st.sidebar.markdown("---")
 st.sidebar.subheader("Export")
+@st.cache_data(ttl=60, show_spinner=False)
+def build_export(version):
+    # Stream cursor rows straight into a constant_memory workbook. pandas.to_excel
+    # writes column-by-column, which constant_memory mode cannot handle.
+    import xlsxwriter
+    xls = io.BytesIO()
+    wb = xlsxwriter.Workbook(xls, {"constant_memory": True})
+    conn = get_conn()
+    for name in ["paddy_types","rice_grades","purchases","milling_input","milling_output","sales"]:
+        ws = wb.add_worksheet(name)
+        cur = conn.execute(f"SELECT * FROM {name}")
+        ws.write_row(0, 0, [d[0] for d in cur.description])
+        for i, row in enumerate(cur, start=1):
+            ws.write_row(i, 0, row)
+    wb.close()
+    return xls.getvalue()
+
 if st.sidebar.button("Export all data (.xlsx)"):
-    with get_conn() as conn:
-        xls = io.BytesIO()
-        with pd.ExcelWriter(xls, engine="xlsxwriter") as writer:
-            for name in ["paddy_types","rice_grades","purchases","milling_input","milling_output","sales"]:
-                pd.read_sql_query(f"SELECT * FROM {name}", conn).to_excel(writer, sheet_name=name, index=False)
-        st.sidebar.download_button("Download RRM_Data.xlsx", xls.getvalue(), file_name="RRM_Data.xlsx")
+    st.sidebar.download_button("Download RRM_Data.xlsx", build_export(db_version()), file_name="RRM_Data.xlsx")
+
+# Masters shared by every tab (one cached read each per rerun)
+paddy_list = load_paddy_types()
+grade_list = load_grades()
+pid_to_name = dict(zip(paddy_list["paddy_id"], paddy_list["paddy_name"]))
+gid_to_name = dict(zip(grade_list["grade_id"], grade_list["grade_name"]))
+gid_to_price = dict(zip(grade_list["grade_id"], grade_list["default_price_qtl"].fillna(0.0)))
 
 # ---------- Dashboard Tab ----------
 tab_dash, tab_masters, tab_pur, tab_mi, tab_mo, tab_sales, tab_stock, tab_yield = st.tabs([
@@ -150,31 +263,29 @@ tab_dash, tab_masters, tab_pur, tab_mi, tab_mo, tab_sales, tab_stock, tab_yield
 
 with tab_dash:
     c1, c2, c3 = st.columns(3)
-    sales_rev = df_read("SELECT COALESCE(SUM(revenue),0) AS v FROM sales")["v"][0]
-    pur_cost  = df_read("SELECT COALESCE(SUM(cost),0) AS v FROM purchases")["v"][0]
-    mil_exp   = df_read("SELECT COALESCE(SUM(expense),0) AS v FROM milling_input")["v"][0]
+    totals    = dashboard_totals(db_version())
+    sales_rev = totals["sales_rev"]
+    pur_cost  = totals["pur_cost"]
+    mil_exp   = totals["mil_exp"]
     gross     = sales_rev - pur_cost - mil_exp
     c1.metric("Sales Revenue (₹)", f"{sales_rev:,.0f}")
     c2.metric("Paddy Cost (₹)", f"{pur_cost:,.0f}")
     c3.metric("Gross Profit (₹)", f"{gross:,.0f}")
 
     st.markdown("#### Daily Summary")
-    daily = df_read("""
-        SELECT dt as Date,
-               COALESCE((SELECT SUM(final_qtl) FROM purchases p WHERE p.dt = s.dt),0) AS Paddy_IN_qtl,
-               COALESCE((SELECT SUM(final_used_qtl) FROM milling_input mi WHERE mi.dt = s.dt),0) AS Paddy_USED_qtl,
-               COALESCE((SELECT SUM(final_out_qtl) FROM milling_output mo WHERE mo.dt = s.dt),0) AS Rice_OUT_qtl,
-               COALESCE((SELECT SUM(final_qtl) FROM sales sa WHERE sa.dt = s.dt AND product='Rice'),0) AS Rice_Sold_qtl,
-               COALESCE((SELECT SUM(revenue) FROM sales sa WHERE sa.dt = s.dt),0) AS Sales_Revenue
-        FROM (
-            SELECT dt FROM purchases
-            UNION SELECT dt FROM milling_input
-            UNION SELECT dt FROM milling_output
-            UNION SELECT dt FROM sales
-        ) s
-        WHERE dt IS NOT NULL AND dt<>''
-        GROUP BY dt ORDER BY dt DESC
-    """)
+    days = st.number_input("Show last N days", min_value=1, value=90, step=30, key="dash_days")
+    since = (date.today() - timedelta(days=int(days))).isoformat()
+    # COALESCE: an all-NULL SUM would come back as string[pyarrow] and break fillna(0)
+    frames = [
+        df_read("SELECT dt AS Date, COALESCE(SUM(final_qtl),0) AS Paddy_IN_qtl FROM purchases WHERE dt >= ? GROUP BY dt", (since,)),
+        df_read("SELECT dt AS Date, COALESCE(SUM(final_used_qtl),0) AS Paddy_USED_qtl FROM milling_input WHERE dt >= ? GROUP BY dt", (since,)),
+        df_read("SELECT dt AS Date, COALESCE(SUM(final_out_qtl),0) AS Rice_OUT_qtl FROM milling_output WHERE dt >= ? GROUP BY dt", (since,)),
+        df_read("""SELECT dt AS Date,
+                          COALESCE(SUM(CASE WHEN product='Rice' THEN final_qtl ELSE 0 END),0) AS Rice_Sold_qtl,
+                          COALESCE(SUM(revenue),0) AS Sales_Revenue
+                   FROM sales WHERE dt >= ? GROUP BY dt""", (since,)),
+    ]
+    daily = reduce(lambda a, b: a.merge(b, on="Date", how="outer"), frames).fillna(0).sort_values("Date", ascending=False)
     st.dataframe(daily, use_container_width=True, height=300)
 
 # ---------- Masters ----------
@@ -186,29 +297,33 @@ with tab_masters:
     with st.expander("Add / Rename"):
         action = st.radio("Action", ["Add","Rename","Delete"], horizontal=True, key="pad_action")
         if action=="Add":
-            pid = st.text_input("Paddy ID (e.g. PAD-1718)")
-            pname = st.text_input("Paddy Name")
-            if st.button("Add Paddy"):
+            with st.form("pad_add", clear_on_submit=True):
+                pid = st.text_input("Paddy ID (e.g. PAD-1718)")
+                pname = st.text_input("Paddy Name")
+                submitted = st.form_submit_button("Add Paddy")
+            if submitted:
                 exec_sql("INSERT INTO paddy_types(paddy_id,paddy_name) VALUES(?,?)", (pid, pname))
                 st.success("Added")
-        st.rerun()
+                st.rerun()
         elif action=="Rename":
             if not paddy.empty:
-                sel = st.selectbox("Choose", paddy["ID"])
-                new = st.text_input("New Name")
-                if st.button("Rename Paddy"):
+                with st.form("pad_rename", clear_on_submit=True):
+                    sel = st.selectbox("Choose", paddy["ID"])
+                    new = st.text_input("New Name")
+                    submitted = st.form_submit_button("Rename Paddy")
+                if submitted:
                     exec_sql("UPDATE paddy_types SET paddy_name=? WHERE paddy_id=?", (new, sel))
                     st.success("Updated")
-            st.rerun()
-            st.rerun()
+                    st.rerun()
         else:
             if not paddy.empty:
-                sel = st.selectbox("Delete Paddy", paddy["ID"])
-                if st.button("Confirm Delete"):
+                with st.form("pad_delete"):
+                    sel = st.selectbox("Delete Paddy", paddy["ID"])
+                    submitted = st.form_submit_button("Confirm Delete")
+                if submitted:
                     exec_sql("DELETE FROM paddy_types WHERE paddy_id=?", (sel,))
                     st.warning("Deleted")
-            st.rerun()
-            st.rerun()
+                    st.rerun()
 
     st.markdown("---")
     st.subheader("Rice Grades / Cuts")
@@ -217,29 +332,33 @@ with tab_masters:
     with st.expander("Add / Edit / Delete Grade"):
         action = st.radio("Action", ["Add","Edit Price","Delete"], horizontal=True, key="grade_action")
         if action=="Add":
-            gid = st.text_input("Grade ID")
-            gname = st.text_input("Grade Name")
-            if st.button("Add Grade"):
+            with st.form("grade_add", clear_on_submit=True):
+                gid = st.text_input("Grade ID")
+                gname = st.text_input("Grade Name")
+                submitted = st.form_submit_button("Add Grade")
+            if submitted:
                 exec_sql("INSERT INTO rice_grades(grade_id,grade_name,default_price_qtl) VALUES(?,?,0)", (gid, gname))
                 st.success("Added")
-        st.rerun()
+                st.rerun()
         elif action=="Edit Price":
             if not grades.empty:
-                sel = st.selectbox("Grade", grades["ID"])
-                price = st.number_input("Default Price (₹/qtl)", min_value=0.0, step=50.0)
-                if st.button("Update Price"):
+                with st.form("grade_price"):
+                    sel = st.selectbox("Grade", grades["ID"])
+                    price = st.number_input("Default Price (₹/qtl)", min_value=0.0, step=50.0)
+                    submitted = st.form_submit_button("Update Price")
+                if submitted:
                     exec_sql("UPDATE rice_grades SET default_price_qtl=? WHERE grade_id=?", (price, sel))
                     st.success("Updated")
-            st.rerun()
-            st.rerun()
+                    st.rerun()
         else:
             if not grades.empty:
-                sel = st.selectbox("Delete Grade", grades["ID"])
-                if st.button("Confirm Delete Grade"):
+                with st.form("grade_delete"):
+                    sel = st.selectbox("Delete Grade", grades["ID"])
+                    submitted = st.form_submit_button("Confirm Delete Grade")
+                if submitted:
                     exec_sql("DELETE FROM rice_grades WHERE grade_id=?", (sel,))
                     st.warning("Deleted")
-            st.rerun()
-            st.rerun()
+                    st.rerun()
 
 # ---------- Purchases with Filters/Edit/Delete ----------
 with tab_pur:
@@ -248,23 +367,22 @@ with tab_pur:
     c1, c2 = st.columns(2)
     dfrom = c1.date_input("From", value=date(2025,1,1))
     dto   = c2.date_input("To", value=date.today())
-    pdata = df_read("SELECT id, dt, paddy_id, final_qtl, rate_qtl, cost, notes FROM purchases ORDER BY id DESC")
-    pdata["Date"] = pdata["dt"].apply(lambda s: to_date(s))
-    mask = (pdata["Date"]>=dfrom) & (pdata["Date"]<=dto)
-    pdata_f = pdata.loc[mask].copy()
-    st.dataframe(pdata_f.drop(columns=["dt"]), use_container_width=True, height=280)
+    pdata_f = df_read("""SELECT id, dt AS Date, paddy_id, final_qtl, rate_qtl, cost, notes FROM purchases
+                         WHERE dt BETWEEN ? AND ? ORDER BY id DESC LIMIT 1000""",
+                      (dfrom.isoformat(), dto.isoformat()))
+    st.dataframe(pdata_f, use_container_width=True, height=280)
 
     st.markdown("**Add New**")
-    paddy_list = df_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
-    c3, c4, c5, c6 = st.columns(4)
-    dt_new = c3.date_input("Date", value=date.today(), key="pur_dt")
-    pid = c4.selectbox("Paddy", paddy_list["paddy_id"], format_func=lambda x: paddy_list.set_index("paddy_id").loc[x,"paddy_name"])
-    qty = c5.number_input("Qty (qtl)", min_value=0.0, step=0.1, key="pur_qty")
-    rate = c6.number_input("Rate (₹/qtl)", min_value=0.0, step=50.0, key="pur_rate")
-    notes = st.text_input("Notes", key="pur_notes")
-    if st.button("Add Purchase", key="pur_add_btn"):
+    with st.form("pur_add", clear_on_submit=True):
+        c3, c4, c5, c6 = st.columns(4)
+        dt_new = c3.date_input("Date", value=date.today(), key="pur_dt")
+        pid = c4.selectbox("Paddy", paddy_list["paddy_id"], format_func=pid_to_name.get)
+        qty = c5.number_input("Qty (qtl)", min_value=0.0, step=0.1, key="pur_qty")
+        rate = c6.number_input("Rate (₹/qtl)", min_value=0.0, step=50.0, key="pur_rate")
+        notes = st.text_input("Notes", key="pur_notes")
+        submitted = st.form_submit_button("Add Purchase")
+    if submitted:
         # insert & refresh
-
         cost = qty*rate
         exec_sql("""INSERT INTO purchases(dt,paddy_id,qty_qtl,qty_kg,final_qtl,rate_qtl,cost,notes)
                     VALUES(?,?,?,?,?,?,?,?)""", (dt_new.isoformat(), pid, qty, 0, qty, rate, cost, notes))
@@ -275,23 +393,26 @@ with tab_pur:
     st.markdown("**Edit / Delete**")
     if not pdata_f.empty:
         row_id = st.selectbox("Select Purchase ID", pdata_f["id"])
-        row = pdata_f[pdata_f["id"]==row_id].iloc[0]
-        e1, e2, e3 = st.columns(3)
-        new_qty = e1.number_input("Qty (qtl)", value=float(row["final_qtl"]), step=0.1, key="pur_edit_qty")
-        new_rate = e2.number_input("Rate (₹/qtl)", value=float(row["rate_qtl"]), step=50.0, key="pur_edit_rate")
-        new_notes = e3.text_input("Notes", value=row["notes"] or "", key="pur_edit_notes")
-        if st.button("Save Changes", key="pur_save"):
+        # Full row only for the record being edited
+        row = fetch_row("SELECT * FROM purchases WHERE id=?", (int(row_id),))
+        with st.form("pur_edit"):
+            e1, e2, e3 = st.columns(3)
+            new_qty = e1.number_input("Qty (qtl)", value=float(row["final_qtl"] or 0), step=0.1, key="pur_edit_qty")
+            new_rate = e2.number_input("Rate (₹/qtl)", value=float(row["rate_qtl"] or 0), step=50.0, key="pur_edit_rate")
+            new_notes = e3.text_input("Notes", value=row["notes"] or "", key="pur_edit_notes")
+            s1, s2 = st.columns(2)
+            save = s1.form_submit_button("Save Changes")
+            delete = s2.form_submit_button("🗑️ Delete Purchase")
+        if save:
             new_cost = new_qty*new_rate
             exec_sql("UPDATE purchases SET final_qtl=?, rate_qtl=?, cost=?, notes=? WHERE id=?",
                      (new_qty, new_rate, new_cost, new_notes, int(row_id)))
             st.success("Updated")
             st.rerun()
-            st.rerun()
-        if st.button("🗑️ Delete Purchase", key="pur_del"):
+        if delete:
             exec_sql("DELETE FROM purchases WHERE id=?", (int(row_id),))
             st.warning("Deleted")
             st.rerun()
-            st.rerun()
 
 # ---------- Milling Input with Filters/Edit/Delete ----------
 with tab_mi:
@@ -299,24 +420,25 @@ with tab_mi:
     c1, c2 = st.columns(2)
     dfrom = c1.date_input("From ", value=date(2025,1,1), key="mi_from")
     dto   = c2.date_input("To ", value=date.today(), key="mi_to")
-    tdf = df_read("SELECT id, dt, paddy_id, final_used_qtl, husk_qtl, polish_qtl, expense, notes FROM milling_input ORDER BY id DESC")
-    tdf["Date"] = tdf["dt"].apply(lambda s: to_date(s))
-    tdf = tdf[(tdf["Date"]>=dfrom) & (tdf["Date"]<=dto)]
-    st.dataframe(tdf.drop(columns=["dt"]), use_container_width=True, height=280)
+    tdf = df_read("""SELECT id, dt AS Date, paddy_id, final_used_qtl, husk_qtl, polish_qtl, expense, notes FROM milling_input
+                     WHERE dt BETWEEN ? AND ? ORDER BY id DESC LIMIT 1000""",
+                  (dfrom.isoformat(), dto.isoformat()))
+    st.dataframe(tdf, use_container_width=True, height=280)
 
 
     st.markdown("**Add New**")
-    paddy_list2 = df_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
-    a1, a2, a3 = st.columns(3)
-    mi_dt = a1.date_input("Date", value=date.today(), key="mi_add_dt")
-    mi_pid = a2.selectbox("Paddy", paddy_list2["paddy_id"], format_func=lambda x: paddy_list2.set_index("paddy_id").loc[x,"paddy_name"], key="mi_add_pid")
-    mi_used = a3.number_input("Used (qtl)", min_value=0.0, step=0.1, key="mi_add_used")
-    b1, b2, b3 = st.columns(3)
-    mi_husk = b1.number_input("Husk (qtl)", min_value=0.0, step=0.1, key="mi_add_husk")
-    mi_pol  = b2.number_input("Polish (qtl)", min_value=0.0, step=0.1, key="mi_add_pol")
-    mi_exp  = b3.number_input("Expense (₹)", min_value=0.0, step=100.0, key="mi_add_exp")
-    mi_notes = st.text_input("Notes", key="mi_add_notes")
-    if st.button("Add Milling Input", key="mi_add_btn"):
+    with st.form("mi_add", clear_on_submit=True):
+        a1, a2, a3 = st.columns(3)
+        mi_dt = a1.date_input("Date", value=date.today(), key="mi_add_dt")
+        mi_pid = a2.selectbox("Paddy", paddy_list["paddy_id"], format_func=pid_to_name.get, key="mi_add_pid")
+        mi_used = a3.number_input("Used (qtl)", min_value=0.0, step=0.1, key="mi_add_used")
+        b1, b2, b3 = st.columns(3)
+        mi_husk = b1.number_input("Husk (qtl)", min_value=0.0, step=0.1, key="mi_add_husk")
+        mi_pol  = b2.number_input("Polish (qtl)", min_value=0.0, step=0.1, key="mi_add_pol")
+        mi_exp  = b3.number_input("Expense (₹)", min_value=0.0, step=100.0, key="mi_add_exp")
+        mi_notes = st.text_input("Notes", key="mi_add_notes")
+        submitted = st.form_submit_button("Add Milling Input")
+    if submitted:
         exec_sql("INSERT INTO milling_input(dt,paddy_id,used_qtl,used_kg,final_used_qtl,husk_qtl,polish_qtl,expense,notes) VALUES(?,?,?,?,?,?,?,?,?)",
                  (mi_dt.isoformat(), mi_pid, mi_used, 0, mi_used, mi_husk, mi_pol, mi_exp, mi_notes))
         st.success("Added")
@@ -327,24 +449,26 @@ with tab_mi:
     st.markdown("---")
     if not tdf.empty:
         row_id = st.selectbox("Select MI ID", tdf["id"])
-        row = tdf[tdf["id"]==row_id].iloc[0]
-        e1, e2, e3, e4 = st.columns(4)
-        used = e1.number_input("Used (qtl)", value=float(row["final_used_qtl"]), step=0.1, key="mi_edit_used")
-        husk = e2.number_input("Husk (qtl)", value=float(row["husk_qtl"] or 0), step=0.1, key="mi_edit_husk")
-        polish = e3.number_input("Polish (qtl)", value=float(row["polish_qtl"] or 0), step=0.1, key="mi_edit_pol")
-        exp = e4.number_input("Expense (₹)", value=float(row["expense"] or 0), step=100.0, key="mi_edit_exp")
-        notes = st.text_input("Notes", value=row["notes"] or "", key="mi_edit_notes")
-        if st.button("Save Changes", key="mi_save"):
+        row = fetch_row("SELECT * FROM milling_input WHERE id=?", (int(row_id),))
+        with st.form("mi_edit"):
+            e1, e2, e3, e4 = st.columns(4)
+            used = e1.number_input("Used (qtl)", value=float(row["final_used_qtl"] or 0), step=0.1, key="mi_edit_used")
+            husk = e2.number_input("Husk (qtl)", value=float(row["husk_qtl"] or 0), step=0.1, key="mi_edit_husk")
+            polish = e3.number_input("Polish (qtl)", value=float(row["polish_qtl"] or 0), step=0.1, key="mi_edit_pol")
+            exp = e4.number_input("Expense (₹)", value=float(row["expense"] or 0), step=100.0, key="mi_edit_exp")
+            notes = st.text_input("Notes", value=row["notes"] or "", key="mi_edit_notes")
+            s1, s2 = st.columns(2)
+            save = s1.form_submit_button("Save Changes")
+            delete = s2.form_submit_button("🗑️ Delete")
+        if save:
             exec_sql("UPDATE milling_input SET final_used_qtl=?, husk_qtl=?, polish_qtl=?, expense=?, notes=? WHERE id=?",
                      (used, husk, polish, exp, notes, int(row_id)))
             st.success("Updated")
             st.rerun()
-            st.rerun()
-        if st.button("🗑️ Delete", key="mi_del"):
+        if delete:
             exec_sql("DELETE FROM milling_input WHERE id=?", (int(row_id),))
             st.warning("Deleted")
             st.rerun()
-            st.rerun()
 
 # ---------- Milling Output with Filters/Edit/Delete ----------
 with tab_mo:
@@ -353,27 +477,27 @@ with tab_mo:
     dfrom = c1.date_input("From  ", value=date(2025,1,1), key="mo_from")
     dto   = c2.date_input("To  ", value=date.today(), key="mo_to")
     grade_filter = c3.text_input("Filter by Grade (name contains)", key="mo_grade_f")
-    mdf = df_read("""SELECT mo.id, mo.dt, mo.paddy_id, g.grade_name, mo.final_out_qtl, mo.notes
+    mdf = df_read("""SELECT mo.id, mo.dt AS Date, mo.paddy_id, g.grade_name, mo.final_out_qtl, mo.notes
                      FROM milling_output mo LEFT JOIN rice_grades g ON mo.grade_id=g.grade_id
-                     ORDER BY mo.id DESC""")
-    mdf["Date"] = mdf["dt"].apply(lambda s: to_date(s))
-    mdf = mdf[(mdf["Date"]>=dfrom) & (mdf["Date"]<=dto)]
+                     WHERE mo.dt BETWEEN ? AND ?
+                     ORDER BY mo.id DESC LIMIT 1000""",
+                  (dfrom.isoformat(), dto.isoformat()))
     if grade_filter:
-        mdf = mdf[mdf["grade_name"].fillna("").str.contains(grade_filter, case=False)]
-    st.dataframe(mdf.drop(columns=["dt"]), use_container_width=True, height=280)
+        mdf = mdf[mdf["grade_name"].fillna("").str.contains(grade_filter, case=False, regex=False)]
+    st.dataframe(mdf, use_container_width=True, height=280)
 
 
     st.markdown("**Add New**")
-    paddy_list3 = df_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
-    grade_list3 = df_read("SELECT grade_id, grade_name FROM rice_grades ORDER BY grade_name")
-    a1, a2, a3 = st.columns(3)
-    mo_dt = a1.date_input("Date", value=date.today(), key="mo_add_dt")
-    mo_pid = a2.selectbox("Paddy", paddy_list3["paddy_id"], format_func=lambda x: paddy_list3.set_index("paddy_id").loc[x,"paddy_name"], key="mo_add_pid")
-    mo_gid = a3.selectbox("Grade", grade_list3["grade_id"], format_func=lambda x: grade_list3.set_index("grade_id").loc[x,"grade_name"], key="mo_add_gid")
-    a4, a5 = st.columns(2)
-    mo_qty = a4.number_input("Rice OUT (qtl)", min_value=0.0, step=0.1, key="mo_add_qty")
-    mo_notes = a5.text_input("Notes", key="mo_add_notes")
-    if st.button("Add Milling Output", key="mo_add_btn"):
+    with st.form("mo_add", clear_on_submit=True):
+        a1, a2, a3 = st.columns(3)
+        mo_dt = a1.date_input("Date", value=date.today(), key="mo_add_dt")
+        mo_pid = a2.selectbox("Paddy", paddy_list["paddy_id"], format_func=pid_to_name.get, key="mo_add_pid")
+        mo_gid = a3.selectbox("Grade", grade_list["grade_id"], format_func=gid_to_name.get, key="mo_add_gid")
+        a4, a5 = st.columns(2)
+        mo_qty = a4.number_input("Rice OUT (qtl)", min_value=0.0, step=0.1, key="mo_add_qty")
+        mo_notes = a5.text_input("Notes", key="mo_add_notes")
+        submitted = st.form_submit_button("Add Milling Output")
+    if submitted:
         exec_sql("INSERT INTO milling_output(dt,paddy_id,grade_id,out_qtl,out_kg,final_out_qtl,notes) VALUES(?,?,?,?,?,?,?)",
                  (mo_dt.isoformat(), mo_pid, mo_gid, mo_qty, 0, mo_qty, mo_notes))
         st.success("Added")
@@ -384,20 +508,22 @@ with tab_mo:
     st.markdown("---")
     if not mdf.empty:
         row_id = st.selectbox("Select MO ID", mdf["id"])
-        row = mdf[mdf["id"]==row_id].iloc[0]
-        e1, e2 = st.columns(2)
-        qty = e1.number_input("Out (qtl)", value=float(row["final_out_qtl"]), step=0.1, key="mo_edit_qty")
-        notes = e2.text_input("Notes", value=row["notes"] or "", key="mo_edit_notes")
-        if st.button("Save Changes", key="mo_save"):
+        row = fetch_row("SELECT * FROM milling_output WHERE id=?", (int(row_id),))
+        with st.form("mo_edit"):
+            e1, e2 = st.columns(2)
+            qty = e1.number_input("Out (qtl)", value=float(row["final_out_qtl"] or 0), step=0.1, key="mo_edit_qty")
+            notes = e2.text_input("Notes", value=row["notes"] or "", key="mo_edit_notes")
+            s1, s2 = st.columns(2)
+            save = s1.form_submit_button("Save Changes")
+            delete = s2.form_submit_button("🗑️ Delete")
+        if save:
             exec_sql("UPDATE milling_output SET final_out_qtl=?, notes=? WHERE id=?", (qty, notes, int(row_id)))
             st.success("Updated")
             st.rerun()
-            st.rerun()
-        if st.button("🗑️ Delete", key="mo_del"):
+        if delete:
             exec_sql("DELETE FROM milling_output WHERE id=?", (int(row_id),))
             st.warning("Deleted")
             st.rerun()
-            st.rerun()
 
 # ---------- Sales with Filters/Edit/Delete ----------
 with tab_sales:
@@ -406,40 +532,40 @@ with tab_sales:
     dfrom = c1.date_input("From   ", value=date(2025,1,1), key="sa_from")
     dto   = c2.date_input("To   ", value=date.today(), key="sa_to")
     prod  = c3.selectbox("Product filter", ["All","Rice","Husk","Polish"], key="sa_prod")
-    sdf = df_read("""SELECT s.id, s.dt, s.product, g.grade_name, s.final_qtl, s.rate_qtl, s.revenue, s.notes
+    sdf = df_read("""SELECT s.id, s.dt AS Date, s.product, g.grade_name, s.final_qtl, s.rate_qtl, s.revenue, s.notes
                      FROM sales s LEFT JOIN rice_grades g ON s.grade_id=g.grade_id
-                     ORDER BY s.id DESC""")
-    sdf["Date"] = sdf["dt"].apply(lambda s: to_date(s))
-    sdf = sdf[(sdf["Date"]>=dfrom) & (sdf["Date"]<=dto)]
-    if prod!="All":
-        sdf = sdf[sdf["product"]==prod]
-    st.dataframe(sdf.drop(columns=["dt"]), use_container_width=True, height=280)
+                     WHERE s.dt BETWEEN ? AND ? AND (?='All' OR s.product=?)
+                     ORDER BY s.id DESC LIMIT 1000""",
+                  (dfrom.isoformat(), dto.isoformat(), prod, prod))
+    st.dataframe(sdf, use_container_width=True, height=280)
 
 
     st.markdown("**Add New**")
-    grade_list4 = df_read("SELECT grade_id, grade_name, default_price_qtl FROM rice_grades ORDER BY grade_name")
-    a1, a2, a3 = st.columns(3)
-    sa_dt = a1.date_input("Date", value=date.today(), key="sa_add_dt")
-    sa_prod = a2.selectbox("Product", ["Rice","Husk","Polish"], key="sa_add_prod")
-    sa_gid = a3.selectbox("Grade (if Rice)", options=[""] + grade_list4["grade_id"].tolist(), index=0,
-                          format_func=lambda x: (grade_list4.set_index("grade_id").loc[x,"grade_name"] if x else ""),
+    # Product/grade stay outside the form so the default rate follows the selection
+    a1, a2 = st.columns(2)
+    sa_prod = a1.selectbox("Product", ["Rice","Husk","Polish"], key="sa_add_prod")
+    sa_gid = a2.selectbox("Grade (if Rice)", options=[""] + grade_list["grade_id"].tolist(), index=0,
+                          format_func=lambda x: gid_to_name.get(x, ""),
                           key="sa_add_gid")
-    b1, b2, b3 = st.columns(3)
-    sa_qty = b1.number_input("Qty (qtl)", min_value=0.0, step=0.1, key="sa_add_qty")
-    # default price
-    def_rate = 0.0
-    try:
-        if sa_prod == "Rice" and sa_gid:
-            def_rate = float(grade_list4.set_index("grade_id").loc[sa_gid,"default_price_qtl"] or 0.0)
-    except Exception:
-        def_rate = 0.0
-    sa_rate = b2.number_input("Rate (₹/qtl)", min_value=0.0, step=50.0, value=def_rate, key="sa_add_rate")
-    sa_notes = b3.text_input("Notes", key="sa_add_notes")
-    if st.button("Add Sale", key="sa_add_btn"):
+    # default price; a keyed number_input ignores a changed value=, so re-seed its state
+    # whenever the product/grade pair changes
+    def_rate = float(gid_to_price.get(sa_gid, 0.0)) if (sa_prod == "Rice" and sa_gid) else 0.0
+    if st.session_state.get("sa_add_rate_for") != (sa_prod, sa_gid):
+        st.session_state["sa_add_rate"] = def_rate
+        st.session_state["sa_add_rate_for"] = (sa_prod, sa_gid)
+    with st.form("sa_add", clear_on_submit=True):
+        b1, b2, b3, b4 = st.columns(4)
+        sa_dt = b1.date_input("Date", value=date.today(), key="sa_add_dt")
+        sa_qty = b2.number_input("Qty (qtl)", min_value=0.0, step=0.1, key="sa_add_qty")
+        sa_rate = b3.number_input("Rate (₹/qtl)", min_value=0.0, step=50.0, key="sa_add_rate")
+        sa_notes = b4.text_input("Notes", key="sa_add_notes")
+        submitted = st.form_submit_button("Add Sale")
+    if submitted:
         revenue = sa_qty * sa_rate if (sa_qty and sa_rate) else 0.0
         exec_sql("INSERT INTO sales(dt,product,grade_id,qty_qtl,qty_kg,final_qtl,rate_qtl,revenue,notes) VALUES(?,?,?,?,?,?,?,?,?)",
                  (sa_dt.isoformat(), sa_prod, (sa_gid if sa_prod=='Rice' and sa_gid else None),
                   sa_qty, 0, sa_qty, sa_rate, revenue, sa_notes))
+        st.session_state.pop("sa_add_rate_for", None)  # clear_on_submit zeroed the rate; re-seed it
         st.success("Added")
         st.rerun()
 
@@ -448,46 +574,59 @@ with tab_sales:
     st.markdown("---")
     if not sdf.empty:
         row_id = st.selectbox("Select Sale ID", sdf["id"])
-        row = sdf[sdf["id"]==row_id].iloc[0]
-        e1, e2, e3 = st.columns(3)
-        qty = e1.number_input("Qty (qtl)", value=float(row["final_qtl"]), step=0.1, key="sa_edit_qty")
-        rate = e2.number_input("Rate (₹/qtl)", value=float(row["rate_qtl"] or 0), step=50.0, key="sa_edit_rate")
-        notes = e3.text_input("Notes", value=row["notes"] or "", key="sa_edit_notes")
-        if st.button("Save Changes", key="sa_save"):
+        row = fetch_row("SELECT * FROM sales WHERE id=?", (int(row_id),))
+        with st.form("sa_edit"):
+            e1, e2, e3 = st.columns(3)
+            qty = e1.number_input("Qty (qtl)", value=float(row["final_qtl"] or 0), step=0.1, key="sa_edit_qty")
+            rate = e2.number_input("Rate (₹/qtl)", value=float(row["rate_qtl"] or 0), step=50.0, key="sa_edit_rate")
+            notes = e3.text_input("Notes", value=row["notes"] or "", key="sa_edit_notes")
+            s1, s2 = st.columns(2)
+            save = s1.form_submit_button("Save Changes")
+            delete = s2.form_submit_button("🗑️ Delete")
+        if save:
             revenue = qty*(rate or 0)
             exec_sql("UPDATE sales SET final_qtl=?, rate_qtl=?, revenue=?, notes=? WHERE id=?",
                      (qty, rate, revenue, notes, int(row_id)))
             st.success("Updated")
             st.rerun()
-            st.rerun()
-        if st.button("🗑️ Delete", key="sa_del"):
+        if delete:
             exec_sql("DELETE FROM sales WHERE id=?", (int(row_id),))
             st.warning("Deleted")
             st.rerun()
-            st.rerun()
 
 # ---------- Stock Ledger ----------
 with tab_stock:
     st.subheader("📒 Stock Ledger")
-    # Paddy stock = Purchases IN - MillingInput USED
-    paddy_in = df_read("SELECT paddy_id, COALESCE(SUM(final_qtl),0) AS in_qtl FROM purchases GROUP BY paddy_id")
-    paddy_used = df_read("SELECT paddy_id, COALESCE(SUM(final_used_qtl),0) AS used_qtl FROM milling_input GROUP BY paddy_id")
-    paddy = pd.merge(paddy_in, paddy_used, on="paddy_id", how="outer").fillna(0)
-    paddy["Closing_qtl"] = paddy["in_qtl"] - paddy["used_qtl"]
-    names = df_read("SELECT paddy_id, paddy_name FROM paddy_types")
-    paddy = paddy.merge(names, on="paddy_id", how="left")
-    paddy = paddy[["paddy_name","in_qtl","used_qtl","Closing_qtl"]].rename(columns={"paddy_name":"Paddy"})
+    # Paddy stock = Purchases IN - MillingInput USED. Ids come from the masters and the
+    # transactions, so rows with a deleted or NULL paddy_id land in "(unknown)".
+    paddy = df_read("""
+        SELECT COALESCE(pt.paddy_name,'(unknown)') AS Paddy,
+               SUM(COALESCE(pi.in_qtl,0)) AS in_qtl,
+               SUM(COALESCE(mu.used_qtl,0)) AS used_qtl,
+               SUM(COALESCE(pi.in_qtl,0) - COALESCE(mu.used_qtl,0)) AS Closing_qtl
+        FROM (SELECT paddy_id FROM paddy_types UNION SELECT paddy_id FROM purchases
+              UNION SELECT paddy_id FROM milling_input) ids
+        LEFT JOIN paddy_types pt ON pt.paddy_id = ids.paddy_id
+        LEFT JOIN (SELECT paddy_id, SUM(final_qtl) AS in_qtl FROM purchases GROUP BY paddy_id) pi ON pi.paddy_id IS ids.paddy_id
+        LEFT JOIN (SELECT paddy_id, SUM(final_used_qtl) AS used_qtl FROM milling_input GROUP BY paddy_id) mu ON mu.paddy_id IS ids.paddy_id
+        GROUP BY Paddy
+        ORDER BY Paddy='(unknown)', Paddy""")
     st.markdown("**Paddy Stock (qtl)**")
     st.dataframe(paddy, use_container_width=True)
 
-    # Rice grade stock = MillingOutput OUT - Sales Rice OUT
-    out = df_read("SELECT grade_id, COALESCE(SUM(final_out_qtl),0) AS out_qtl FROM milling_output GROUP BY grade_id")
-    sold = df_read("SELECT grade_id, COALESCE(SUM(final_qtl),0) AS sold_qtl FROM sales WHERE product='Rice' GROUP BY grade_id")
-    grade = pd.merge(out, sold, on="grade_id", how="outer").fillna(0)
-    grade["Closing_qtl"] = grade["out_qtl"] - grade["sold_qtl"]
-    gnames = df_read("SELECT grade_id, grade_name FROM rice_grades")
-    grade = grade.merge(gnames, on="grade_id", how="left")
-    grade = grade[["grade_name","out_qtl","sold_qtl","Closing_qtl"]].rename(columns={"grade_name":"Grade"})
+    # Rice grade stock = MillingOutput OUT - Sales Rice OUT (ungraded rice sales land in "(unknown)")
+    grade = df_read("""
+        SELECT COALESCE(g.grade_name,'(unknown)') AS Grade,
+               SUM(COALESCE(mo.out_qtl,0)) AS out_qtl,
+               SUM(COALESCE(sa.sold_qtl,0)) AS sold_qtl,
+               SUM(COALESCE(mo.out_qtl,0) - COALESCE(sa.sold_qtl,0)) AS Closing_qtl
+        FROM (SELECT grade_id FROM rice_grades UNION SELECT grade_id FROM milling_output
+              UNION SELECT grade_id FROM sales WHERE product='Rice') ids
+        LEFT JOIN rice_grades g ON g.grade_id = ids.grade_id
+        LEFT JOIN (SELECT grade_id, SUM(final_out_qtl) AS out_qtl FROM milling_output GROUP BY grade_id) mo ON mo.grade_id IS ids.grade_id
+        LEFT JOIN (SELECT grade_id, SUM(final_qtl) AS sold_qtl FROM sales WHERE product='Rice' GROUP BY grade_id) sa ON sa.grade_id IS ids.grade_id
+        GROUP BY Grade
+        ORDER BY Grade='(unknown)', Grade""")
     st.markdown("**Rice Grade Stock (qtl)**")
     st.dataframe(grade, use_container_width=True)
 
@@ -496,36 +635,22 @@ with tab_stock:
 # ---------- Yield % Report ----------
 with tab_yield:
     st.subheader("📊 Yield % Report")
-    # Overall by Paddy (SQL fine)
-    out_by_paddy = df_read("""SELECT paddy_id, COALESCE(SUM(final_out_qtl),0) AS rice_out_qtl
-                              FROM milling_output GROUP BY paddy_id""")
-    used_by_paddy = df_read("""SELECT paddy_id, COALESCE(SUM(final_used_qtl),0) AS paddy_used_qtl
-                               FROM milling_input GROUP BY paddy_id""")
-    y = pd.merge(used_by_paddy, out_by_paddy, on="paddy_id", how="outer").fillna(0)
-    names = df_read("SELECT paddy_id, paddy_name FROM paddy_types")
-    y = y.merge(names, on="paddy_id", how="left")
-    # Safe numeric conversion
-    y["rice_out_qtl"] = pd.to_numeric(y["rice_out_qtl"], errors="coerce")
-    y["paddy_used_qtl"] = pd.to_numeric(y["paddy_used_qtl"], errors="coerce")
-    y["Yield_%"] = ((y["rice_out_qtl"] / y["paddy_used_qtl"].replace({0: pd.NA})) * 100).round(2)
-    y = y[["paddy_name","paddy_used_qtl","rice_out_qtl","Yield_%"]].rename(columns={"paddy_name":"Paddy","paddy_used_qtl":"Paddy Used (qtl)","rice_out_qtl":"Rice Out (qtl)"})
+    # Overall by Paddy: join, totals and yield in one statement; unmatched paddy_ids go to "(unknown)"
+    y = df_read("""
+        SELECT COALESCE(pt.paddy_name,'(unknown)') AS Paddy,
+               SUM(COALESCE(mi.u,0)) AS "Paddy Used (qtl)",
+               SUM(COALESCE(mo.o,0)) AS "Rice Out (qtl)",
+               CASE WHEN SUM(COALESCE(mi.u,0))=0 THEN NULL
+                    ELSE ROUND(100.0*SUM(COALESCE(mo.o,0))/SUM(mi.u), 2) END AS "Yield_%"
+        FROM (SELECT paddy_id FROM milling_input UNION SELECT paddy_id FROM milling_output) ids
+        LEFT JOIN paddy_types pt ON pt.paddy_id = ids.paddy_id
+        LEFT JOIN (SELECT paddy_id, SUM(final_used_qtl) u FROM milling_input GROUP BY paddy_id) mi ON mi.paddy_id IS ids.paddy_id
+        LEFT JOIN (SELECT paddy_id, SUM(final_out_qtl) o FROM milling_output GROUP BY paddy_id) mo ON mo.paddy_id IS ids.paddy_id
+        GROUP BY Paddy
+        ORDER BY Paddy='(unknown)', Paddy""")
     st.markdown("**Overall Yield by Paddy Type**")
     st.dataframe(y, use_container_width=True)
 
-    # Daily yield using pandas (avoids SQL UNION issues)
-    mi_df = df_read("SELECT dt, final_used_qtl FROM milling_input").copy()
-    mo_df = df_read("SELECT dt, final_out_qtl FROM milling_output").copy()
-    # Ensure date and numeric types
-    mi_df["dt"] = pd.to_datetime(mi_df["dt"], errors="coerce").dt.date
-    mi_df["final_used_qtl"] = pd.to_numeric(mi_df["final_used_qtl"], errors="coerce")
-    mo_df["dt"] = pd.to_datetime(mo_df["dt"], errors="coerce").dt.date
-    mo_df["final_out_qtl"] = pd.to_numeric(mo_df["final_out_qtl"], errors="coerce")
-    # Group by date
-    mi_g = mi_df.groupby("dt", dropna=True)["final_used_qtl"].sum().rename("Paddy_Used_qtl")
-    mo_g = mo_df.groupby("dt", dropna=True)["final_out_qtl"].sum().rename("Rice_Out_qtl")
-    dy = pd.concat([mi_g, mo_g], axis=1).fillna(0.0).reset_index().rename(columns={"dt":"Date"})
-    if not dy.empty:
-        dy["Yield_%"] = (dy["Rice_Out_qtl"] * 100.0 / dy["Paddy_Used_qtl"].replace({0: pd.NA})).round(2)
-        dy = dy.sort_values("Date", ascending=False)
+    dy = daily_yield(db_version())
     st.markdown("**Daily Yield (All Paddies)**")
     st.dataframe(dy, use_container_width=True, height=280)
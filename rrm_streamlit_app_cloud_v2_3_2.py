@@ -2,8 +2,9 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
-from datetime import date, datetime
-import io, os
+from streamlit.connections import BaseConnection
+from datetime import date
+import io, os, threading
 
 st.set_page_config(page_title="RRM Rice Mill Tracker", layout="wide")
 
@@ -14,54 +15,127 @@ DB_PATH = os.path.join(DATA_DIR, "rrm_tracker.db")
 KG_PER_QTL_DEFAULT = 100
 
 # ---------- DB helpers ----------
+def apply_pragmas(c):
+    # Per-connection settings
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA temp_store=MEMORY")
+    c.execute("PRAGMA mmap_size=268435456")
+    c.execute("PRAGMA cache_size=-65536")
+
+class SQLiteConnection(BaseConnection[sqlite3.Connection]):
+    """st.connection backend for the local DB file: one process-wide autocommit
+       connection with the app PRAGMAs, created and cached by Streamlit."""
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        c = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        # WAL: no rollback journal per commit, readers don't block on writers
+        c.execute("PRAGMA journal_mode=WAL")
+        apply_pragmas(c)
+        return c
+
+    @property
+    def raw(self) -> sqlite3.Connection:
+        return self._instance
+
 def get_conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    return st.connection("rrm", type=SQLiteConnection).raw
+
+@st.cache_resource
+def get_write_lock():
+    # Sessions share one connection; serialize writes so BEGIN/executescript don't interleave
+    return threading.Lock()
+
+# Full schema in one script; v_totals is created last and marks a complete schema
+DDL = f"""
+CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS paddy_types (paddy_id TEXT PRIMARY KEY, paddy_name TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS rice_grades (
+    grade_id TEXT PRIMARY KEY, grade_name TEXT UNIQUE, default_price_qtl REAL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS purchases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, dt TEXT, paddy_id TEXT,
+    qty_qtl REAL, qty_kg REAL, final_qtl REAL, rate_qtl REAL, cost REAL, notes TEXT);
+CREATE TABLE IF NOT EXISTS milling_input (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, dt TEXT, paddy_id TEXT,
+    used_qtl REAL, used_kg REAL, final_used_qtl REAL,
+    husk_qtl REAL, polish_qtl REAL, expense REAL, notes TEXT);
+CREATE TABLE IF NOT EXISTS milling_output (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, dt TEXT, paddy_id TEXT, grade_id TEXT,
+    out_qtl REAL, out_kg REAL, final_out_qtl REAL, notes TEXT);
+CREATE TABLE IF NOT EXISTS sales (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, dt TEXT, product TEXT, grade_id TEXT,
+    qty_qtl REAL, qty_kg REAL, final_qtl REAL, rate_qtl REAL, revenue REAL, notes TEXT);
+-- Date-range filters in every transaction tab
+CREATE INDEX IF NOT EXISTS idx_purchases_dt ON purchases(dt);
+CREATE INDEX IF NOT EXISTS idx_milling_input_dt ON milling_input(dt);
+CREATE INDEX IF NOT EXISTS idx_milling_output_dt ON milling_output(dt);
+CREATE INDEX IF NOT EXISTS idx_sales_dt ON sales(dt);
+-- Covering indexes for the Stock Ledger / Yield GROUP BY sums
+CREATE INDEX IF NOT EXISTS idx_pur_pid ON purchases(paddy_id, final_qtl);
+CREATE INDEX IF NOT EXISTS idx_mi_pid ON milling_input(paddy_id, final_used_qtl);
+CREATE INDEX IF NOT EXISTS idx_mo_pid_gid ON milling_output(paddy_id, grade_id, final_out_qtl);
+CREATE INDEX IF NOT EXISTS idx_mo_gid ON milling_output(grade_id, final_out_qtl);
+CREATE INDEX IF NOT EXISTS idx_sa_gid ON sales(grade_id, product, final_qtl);
+-- Dashboard totals: single-column indexes let each SUM scan the index instead of the table
+CREATE INDEX IF NOT EXISTS idx_sales_rev ON sales(revenue);
+CREATE INDEX IF NOT EXISTS idx_pur_cost ON purchases(cost);
+CREATE INDEX IF NOT EXISTS idx_mi_exp ON milling_input(expense);
+INSERT OR IGNORE INTO config(key,value) VALUES('kg_per_qtl','{KG_PER_QTL_DEFAULT}');
+CREATE VIEW IF NOT EXISTS v_totals AS SELECT
+    (SELECT COALESCE(SUM(revenue),0) FROM sales) sales_rev,
+    (SELECT COALESCE(SUM(cost),0) FROM purchases) pur_cost,
+    (SELECT COALESCE(SUM(expense),0) FROM milling_input) mil_exp;
+"""
 
 def init_db():
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT)")
-        cur.execute("CREATE TABLE IF NOT EXISTS paddy_types (paddy_id TEXT PRIMARY KEY, paddy_name TEXT UNIQUE)")
-        cur.execute("""CREATE TABLE IF NOT EXISTS rice_grades (
-                        grade_id TEXT PRIMARY KEY, grade_name TEXT UNIQUE, default_price_qtl REAL DEFAULT 0)""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS purchases (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT, dt TEXT, paddy_id TEXT,
-                        qty_qtl REAL, qty_kg REAL, final_qtl REAL, rate_qtl REAL, cost REAL, notes TEXT)""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS milling_input (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT, dt TEXT, paddy_id TEXT,
-                        used_qtl REAL, used_kg REAL, final_used_qtl REAL,
-                        husk_qtl REAL, polish_qtl REAL, expense REAL, notes TEXT)""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS milling_output (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT, dt TEXT, paddy_id TEXT, grade_id TEXT,
-                        out_qtl REAL, out_kg REAL, final_out_qtl REAL, notes TEXT)""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS sales (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT, dt TEXT, product TEXT, grade_id TEXT,
-                        qty_qtl REAL, qty_kg REAL, final_qtl REAL, rate_qtl REAL, revenue REAL, notes TEXT)""")
-        conn.commit()
-        cur.execute("INSERT OR IGNORE INTO config(key,value) VALUES('kg_per_qtl',?)", (str(KG_PER_QTL_DEFAULT),))
-        # seeds
-        cur.execute("INSERT OR IGNORE INTO paddy_types(paddy_id,paddy_name) VALUES('PAD-1121','1121'),('PAD-1509','1509'),('PAD-PR14','PR-14')")
-        cur.execute("""INSERT OR IGNORE INTO rice_grades(grade_id,grade_name,default_price_qtl) VALUES
-            ('GRD-WAND','Wand',0),('GRD-S2ND','Super 2nd Wand',0),('GRD-2ND','2nd Wand',0),
-            ('GRD-TIBAR','Tibar',0),('GRD-SDUB','Super Dubar',0),('GRD-DUB','Dubar',0),
-            ('GRD-MDUB','Mini Dubar',0),('GRD-SMOG','Super Mogara',0),('GRD-MOG','Mogara',0),
-            ('GRD-MMOG','Mini Mogara',0)""")
-        conn.commit()
+    conn = get_conn()
+    # Warm restart: schema already complete, nothing to do
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='view' AND name='v_totals'").fetchone():
+        return
+    with get_write_lock():
+        conn.executescript(DDL)
+    # seeds
+    exec_many("INSERT OR IGNORE INTO paddy_types(paddy_id,paddy_name) VALUES(?,?)",
+              [("PAD-1121","1121"),("PAD-1509","1509"),("PAD-PR14","PR-14")])
+    exec_many("INSERT OR IGNORE INTO rice_grades(grade_id,grade_name,default_price_qtl) VALUES(?,?,0)", [
+        ("GRD-WAND","Wand"),("GRD-S2ND","Super 2nd Wand"),("GRD-2ND","2nd Wand"),
+        ("GRD-TIBAR","Tibar"),("GRD-SDUB","Super Dubar"),("GRD-DUB","Dubar"),
+        ("GRD-MDUB","Mini Dubar"),("GRD-SMOG","Super Mogara"),("GRD-MOG","Mogara"),
+        ("GRD-MMOG","Mini Mogara"),
+    ])
 
 def df_read(sql, params=()):
-    with get_conn() as conn:
-        return pd.read_sql_query(sql, conn, params=params)
+    return pd.read_sql_query(sql, get_conn(), params=params)
 
-def exec_sql(sql, params=()):
-    with get_conn() as conn:
-        conn.execute(sql, params)
-        conn.commit()
+def scalar(sql, params=()):
+    # Single values straight from the cursor, no DataFrame
+    return get_conn().execute(sql, params).fetchone()[0]
+
+@st.cache_data(ttl=5, show_spinner=False)
+def df_read_cached(sql, params=()):
+    # Masters and aggregates repeat across tabs; serve them from cache within a rerun
+    return df_read(sql, params)
+
+@st.cache_data(ttl=5, show_spinner=False)
+def rows_read_cached(sql, params=()):
+    # Tiny result sets as list-of-dicts; st.dataframe renders them without pandas
+    cur = get_conn().cursor()
+    cur.row_factory = sqlite3.Row
+    return [dict(r) for r in cur.execute(sql, params).fetchall()]
 
-def to_date(s):
-    try:
-        return datetime.strptime(s, "%Y-%m-%d").date()
-    except:
-        return None
+def exec_sql(sql, params=()):
+    with get_write_lock():
+        get_conn().execute(sql, params)
+    df_read_cached.clear()
+    rows_read_cached.clear()
+
+def exec_many(sql, rows):
+    # One transaction for the whole batch (e.g. seeds, CSV imports);
+    # the connection is autocommit, so BEGIN explicitly
+    conn = get_conn()
+    with get_write_lock(), conn:
+        conn.execute("BEGIN")
+        conn.executemany(sql, rows)
+    df_read_cached.clear()
+    rows_read_cached.clear()
 
 # Initialize DB
 init_db()
@@ -72,8 +146,7 @@ st.sidebar.header("Settings")
 
 # robust read of KG per quintal
 try:
-    cfg_df = df_read("SELECT value FROM config WHERE key='kg_per_qtl'")
-    _kg = int(float(cfg_df["value"].iloc[0])) if not cfg_df.empty else KG_PER_QTL_DEFAULT
+    _kg = int(float(scalar("SELECT value FROM config WHERE key='kg_per_qtl'")))
 except Exception:
     _kg = KG_PER_QTL_DEFAULT
 kg_per_qtl = st.sidebar.number_input("KG per Quintal", min_value=1, max_value=200, value=_kg)
@@ -86,12 +159,20 @@ if st.sidebar.button("Save Conversion"):
 st.sidebar.markdown("---")
 st.sidebar.subheader("Export")
 if st.sidebar.button("Export all data (.xlsx)"):
-    with get_conn() as conn:
-        xls = io.BytesIO()
-        with pd.ExcelWriter(xls, engine="xlsxwriter") as writer:
-            for name in ["paddy_types","rice_grades","purchases","milling_input","milling_output","sales"]:
-                pd.read_sql_query(f"SELECT * FROM {name}", conn).to_excel(writer, sheet_name=name, index=False)
-        st.sidebar.download_button("Download RRM_Data.xlsx", xls.getvalue(), file_name="RRM_Data.xlsx")
+    import xlsxwriter
+    conn = get_conn()
+    xls = io.BytesIO()
+    # constant_memory flushes each row as it is written, so cursor rows stream
+    # straight through; pandas.to_excel writes column-by-column and cannot.
+    wb = xlsxwriter.Workbook(xls, {"constant_memory": True})
+    for name in ["paddy_types","rice_grades","purchases","milling_input","milling_output","sales"]:
+        ws = wb.add_worksheet(name)
+        cur = conn.execute(f"SELECT * FROM {name}")
+        ws.write_row(0, 0, [d[0] for d in cur.description])
+        for i, row in enumerate(cur, start=1):
+            ws.write_row(i, 0, row)
+    wb.close()
+    st.sidebar.download_button("Download RRM_Data.xlsx", xls.getvalue(), file_name="RRM_Data.xlsx")
 
 # ---------- Helper to layout forms (fixed) ----------
 def cols(n:int):
@@ -99,31 +180,34 @@ def cols(n:int):
        In mobile mode, return n separate full-width containers stacked vertically,
        so callers can always unpack: c1, c2 = cols(2), etc."""
     if mobile_mode:
-        # Create n independent single columns (stacked vertically)
-        return [st.columns(1)[0] for _ in range(n)]
-    else:
-        return list(st.columns(n))
+        # Plain containers stack vertically and are lighter than 1-column layouts
+        return [st.container() for _ in range(n)]
+    return st.columns(n)
 
 # ---------- Tabs ----------
+# Each tab renders in its own fragment, so a widget change reruns only that tab
 tab_dash, tab_masters, tab_pur, tab_mi, tab_mo, tab_sales, tab_stock, tab_yield = st.tabs([
     "Dashboard","Masters","Purchases","Milling Input","Milling Output","Sales","Stock Ledger","Yield % Report"
 ])
 
 # ----- Dashboard -----
-with tab_dash:
+@st.fragment
+def render_dashboard():
     c1, c2, c3 = st.columns(3)
-    sales_rev = df_read("SELECT COALESCE(SUM(revenue),0) AS v FROM sales")["v"][0]
-    pur_cost  = df_read("SELECT COALESCE(SUM(cost),0) AS v FROM purchases")["v"][0]
-    mil_exp   = df_read("SELECT COALESCE(SUM(expense),0) AS v FROM milling_input")["v"][0]
+    sales_rev, pur_cost, mil_exp = get_conn().execute("SELECT * FROM v_totals").fetchone()
     gross     = sales_rev - pur_cost - mil_exp
     c1.metric("Sales Revenue (₹)", f"{sales_rev:,.0f}")
     c2.metric("Paddy Cost (₹)", f"{pur_cost:,.0f}")
     c3.metric("Gross Profit (₹)", f"{gross:,.0f}")
 
+with tab_dash:
+    render_dashboard()
+
 # ----- Masters -----
-with tab_masters:
+@st.fragment
+def render_masters():
     st.subheader("Paddy Types")
-    paddy = df_read("SELECT paddy_id AS ID, paddy_name AS Name FROM paddy_types ORDER BY Name")
+    paddy = df_read_cached("SELECT paddy_id AS ID, paddy_name AS Name FROM paddy_types ORDER BY Name")
     st.dataframe(paddy, use_container_width=True)
     with st.expander("Add / Rename / Delete"):
         action = st.radio("Action", ["Add","Rename","Delete"], horizontal=True, key="pad_action")
@@ -149,7 +233,7 @@ with tab_masters:
 
     st.markdown("---")
     st.subheader("Rice Grades / Cuts")
-    grades = df_read("SELECT grade_id AS ID, grade_name AS Name, default_price_qtl AS DefaultPrice FROM rice_grades ORDER BY Name")
+    grades = df_read_cached("SELECT grade_id AS ID, grade_name AS Name, default_price_qtl AS DefaultPrice FROM rice_grades ORDER BY Name")
     st.dataframe(grades, use_container_width=True)
     with st.expander("Add / Edit Price / Delete"):
         gact = st.radio("Action", ["Add","Edit Price","Delete"], horizontal=True, key="grade_action")
@@ -173,23 +257,26 @@ with tab_masters:
                     exec_sql("DELETE FROM rice_grades WHERE grade_id=?", (sel,))
                     st.warning("Deleted"); st.rerun()
 
+with tab_masters:
+    render_masters()
+
 # ----- Purchases -----
-with tab_pur:
+@st.fragment
+def render_purchases():
     st.subheader("🛒 Purchases")
     c1, c2 = cols(2)
     dfrom = c1.date_input("From", value=date(2025,1,1), key="pur_from")
     dto   = c2.date_input("To", value=date.today(), key="pur_to")
-    pdata = df_read("SELECT id, dt, paddy_id, final_qtl, rate_qtl, cost, notes FROM purchases ORDER BY id DESC")
-    pdata["Date"] = pdata["dt"].apply(lambda s: to_date(s))
-    mask = (pdata["Date"]>=dfrom) & (pdata["Date"]<=dto)
-    pdata_f = pdata.loc[mask].copy()
-    st.dataframe(pdata_f.drop(columns=["dt"]), use_container_width=True, height=280)
+    pdata_f = df_read("""SELECT id, date(dt) AS Date, paddy_id, final_qtl, rate_qtl, cost, notes FROM purchases
+                         WHERE dt BETWEEN ? AND ? ORDER BY id DESC""", (dfrom.isoformat(), dto.isoformat()))
+    st.dataframe(pdata_f, use_container_width=True, height=280)
 
     st.markdown("**Add New**")
-    paddy_list = df_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
+    paddy_list = df_read_cached("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
+    _pname = dict(zip(paddy_list["paddy_id"], paddy_list["paddy_name"]))
     a1, a2, a3, a4 = cols(4)
     dt_new = a1.date_input("Date", value=date.today(), key="pur_dt2")
-    pid = a2.selectbox("Paddy", paddy_list["paddy_id"], format_func=lambda x: paddy_list.set_index("paddy_id").loc[x,"paddy_name"])
+    pid = a2.selectbox("Paddy", paddy_list["paddy_id"], format_func=_pname.get)
     qty = a3.number_input("Qty (qtl)", min_value=0.0, step=0.1, key="pur_qty2")
     rate = a4.number_input("Rate (₹/qtl)", min_value=0.0, step=50.0, key="pur_rate2")
     notes = st.text_input("Notes", key="pur_notes2")
@@ -202,10 +289,11 @@ with tab_pur:
     st.markdown("---"); st.markdown("**Edit / Delete**")
     if not pdata_f.empty:
         row_id = st.selectbox("Select Purchase ID", pdata_f["id"], key="pur_row")
-        row = pdata_f[pdata_f["id"]==row_id].iloc[0]
+        # Fresh by primary key: O(1), and current even if another session edited it
+        row = df_read("SELECT * FROM purchases WHERE id=?", (int(row_id),)).iloc[0]
         e1, e2, e3 = cols(3)
-        new_qty = e1.number_input("Qty (qtl)", value=float(row["final_qtl"]), step=0.1, key="pur_edit_qty2")
-        new_rate = e2.number_input("Rate (₹/qtl)", value=float(row["rate_qtl"]), step=50.0, key="pur_edit_rate2")
+        new_qty = e1.number_input("Qty (qtl)", value=float(row["final_qtl"] or 0), step=0.1, key="pur_edit_qty2")
+        new_rate = e2.number_input("Rate (₹/qtl)", value=float(row["rate_qtl"] or 0), step=50.0, key="pur_edit_rate2")
         new_notes = e3.text_input("Notes", value=row["notes"] or "", key="pur_edit_notes2")
         if st.button("Save Changes", key="pur_save2"):
             new_cost = new_qty*new_rate
@@ -216,22 +304,26 @@ with tab_pur:
             exec_sql("DELETE FROM purchases WHERE id=?", (int(row_id),))
             st.warning("Deleted"); st.rerun()
 
+with tab_pur:
+    render_purchases()
+
 # ----- Milling Input -----
-with tab_mi:
+@st.fragment
+def render_milling_input():
     st.subheader("⚙️ Milling Input")
     c1, c2 = cols(2)
     dfrom = c1.date_input("From ", value=date(2025,1,1), key="mi_from2")
     dto   = c2.date_input("To ", value=date.today(), key="mi_to2")
-    tdf = df_read("SELECT id, dt, paddy_id, final_used_qtl, husk_qtl, polish_qtl, expense, notes FROM milling_input ORDER BY id DESC")
-    tdf["Date"] = tdf["dt"].apply(lambda s: to_date(s))
-    tdf = tdf[(tdf["Date"]>=dfrom) & (tdf["Date"]<=dto)]
-    st.dataframe(tdf.drop(columns=["dt"]), use_container_width=True, height=280)
+    tdf = df_read("""SELECT id, date(dt) AS Date, paddy_id, final_used_qtl, husk_qtl, polish_qtl, expense, notes FROM milling_input
+                     WHERE dt BETWEEN ? AND ? ORDER BY id DESC""", (dfrom.isoformat(), dto.isoformat()))
+    st.dataframe(tdf, use_container_width=True, height=280)
 
     st.markdown("**Add New**")
-    paddy_list2 = df_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
+    paddy_list2 = df_read_cached("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
+    _pname = dict(zip(paddy_list2["paddy_id"], paddy_list2["paddy_name"]))
     a1, a2, a3 = cols(3)
     mi_dt = a1.date_input("Date", value=date.today(), key="mi_add_dt2")
-    mi_pid = a2.selectbox("Paddy", paddy_list2["paddy_id"], format_func=lambda x: paddy_list2.set_index("paddy_id").loc[x,"paddy_name"], key="mi_add_pid2")
+    mi_pid = a2.selectbox("Paddy", paddy_list2["paddy_id"], format_func=_pname.get, key="mi_add_pid2")
     mi_used = a3.number_input("Used (qtl)", min_value=0.0, step=0.1, key="mi_add_used2")
     b1, b2, b3 = cols(3)
     mi_husk = b1.number_input("Husk (qtl)", min_value=0.0, step=0.1, key="mi_add_husk2")
@@ -246,9 +338,9 @@ with tab_mi:
     st.markdown("---")
     if not tdf.empty:
         row_id = st.selectbox("Select MI ID", tdf["id"], key="mi_row2")
-        row = tdf[tdf["id"]==row_id].iloc[0]
+        row = df_read("SELECT * FROM milling_input WHERE id=?", (int(row_id),)).iloc[0]
         e1, e2, e3, e4 = cols(4)
-        used = e1.number_input("Used (qtl)", value=float(row["final_used_qtl"]), step=0.1, key="mi_edit_used2")
+        used = e1.number_input("Used (qtl)", value=float(row["final_used_qtl"] or 0), step=0.1, key="mi_edit_used2")
         husk = e2.number_input("Husk (qtl)", value=float(row["husk_qtl"] or 0), step=0.1, key="mi_edit_husk2")
         polish = e3.number_input("Polish (qtl)", value=float(row["polish_qtl"] or 0), step=0.1, key="mi_edit_pol2")
         exp = e4.number_input("Expense (₹)", value=float(row["expense"] or 0), step=100.0, key="mi_edit_exp2")
@@ -261,29 +353,35 @@ with tab_mi:
             exec_sql("DELETE FROM milling_input WHERE id=?", (int(row_id),))
             st.warning("Deleted"); st.rerun()
 
+with tab_mi:
+    render_milling_input()
+
 # ----- Milling Output -----
-with tab_mo:
+@st.fragment
+def render_milling_output():
     st.subheader("📦 Milling Output (ANY Paddy × ANY Grade)")
     c1, c2, c3 = cols(3)
     dfrom = c1.date_input("From  ", value=date(2025,1,1), key="mo_from2")
     dto   = c2.date_input("To  ", value=date.today(), key="mo_to2")
     grade_filter = c3.text_input("Filter by Grade (name contains)", key="mo_grade_f2")
-    mdf = df_read("""SELECT mo.id, mo.dt, mo.paddy_id, g.grade_name, mo.final_out_qtl, mo.notes
+    # Match the typed text literally: escape LIKE wildcards and the escape char itself
+    grade_like = grade_filter.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    mdf = df_read("""SELECT mo.id, date(mo.dt) AS Date, mo.paddy_id, g.grade_name, mo.final_out_qtl, mo.notes
                      FROM milling_output mo LEFT JOIN rice_grades g ON mo.grade_id=g.grade_id
-                     ORDER BY mo.id DESC""")
-    mdf["Date"] = mdf["dt"].apply(lambda s: to_date(s))
-    mdf = mdf[(mdf["Date"]>=dfrom) & (mdf["Date"]<=dto)]
-    if grade_filter:
-        mdf = mdf[mdf["grade_name"].fillna("").str.contains(grade_filter, case=False)]
-    st.dataframe(mdf.drop(columns=["dt"]), use_container_width=True, height=280)
+                     WHERE mo.dt BETWEEN ? AND ? AND (?='' OR g.grade_name LIKE ? ESCAPE '\\')
+                     ORDER BY mo.id DESC""",
+                  (dfrom.isoformat(), dto.isoformat(), grade_filter, f"%{grade_like}%"))
+    st.dataframe(mdf, use_container_width=True, height=280)
 
     st.markdown("**Add New**")
-    paddy_list3 = df_read("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
-    grade_list3 = df_read("SELECT grade_id, grade_name FROM rice_grades ORDER BY grade_name")
+    paddy_list3 = df_read_cached("SELECT paddy_id, paddy_name FROM paddy_types ORDER BY paddy_name")
+    grade_list3 = df_read_cached("SELECT grade_id, grade_name FROM rice_grades ORDER BY grade_name")
+    _pname = dict(zip(paddy_list3["paddy_id"], paddy_list3["paddy_name"]))
+    _gname = dict(zip(grade_list3["grade_id"], grade_list3["grade_name"]))
     a1, a2, a3 = cols(3)
     mo_dt = a1.date_input("Date", value=date.today(), key="mo_add_dt2")
-    mo_pid = a2.selectbox("Paddy", paddy_list3["paddy_id"], format_func=lambda x: paddy_list3.set_index("paddy_id").loc[x,"paddy_name"], key="mo_add_pid2")
-    mo_gid = a3.selectbox("Grade", grade_list3["grade_id"], format_func=lambda x: grade_list3.set_index("grade_id").loc[x,"grade_name"], key="mo_add_gid2")
+    mo_pid = a2.selectbox("Paddy", paddy_list3["paddy_id"], format_func=_pname.get, key="mo_add_pid2")
+    mo_gid = a3.selectbox("Grade", grade_list3["grade_id"], format_func=_gname.get, key="mo_add_gid2")
     b1, b2 = cols(2)
     mo_qty = b1.number_input("Rice OUT (qtl)", min_value=0.0, step=0.1, key="mo_add_qty2")
     mo_notes = b2.text_input("Notes", key="mo_add_notes2")
@@ -295,9 +393,9 @@ with tab_mo:
     st.markdown("---")
     if not mdf.empty:
         row_id = st.selectbox("Select MO ID", mdf["id"], key="mo_row2")
-        row = mdf[mdf["id"]==row_id].iloc[0]
+        row = df_read("SELECT * FROM milling_output WHERE id=?", (int(row_id),)).iloc[0]
         e1, e2 = cols(2)
-        qty = e1.number_input("Out (qtl)", value=float(row["final_out_qtl"]), step=0.1, key="mo_edit_qty2")
+        qty = e1.number_input("Out (qtl)", value=float(row["final_out_qtl"] or 0), step=0.1, key="mo_edit_qty2")
         notes = e2.text_input("Notes", value=row["notes"] or "", key="mo_edit_notes2")
         if st.button("Save Changes", key="mo_save2"):
             exec_sql("UPDATE milling_output SET final_out_qtl=?, notes=? WHERE id=?", (qty, notes, int(row_id)))
@@ -306,39 +404,42 @@ with tab_mo:
             exec_sql("DELETE FROM milling_output WHERE id=?", (int(row_id),))
             st.warning("Deleted"); st.rerun()
 
+with tab_mo:
+    render_milling_output()
+
 # ----- Sales -----
-with tab_sales:
+@st.fragment
+def render_sales():
     st.subheader("🧾 Sales")
     c1, c2, c3 = cols(3)
     dfrom = c1.date_input("From   ", value=date(2025,1,1), key="sa_from2")
     dto   = c2.date_input("To   ", value=date.today(), key="sa_to2")
     prod  = c3.selectbox("Product filter", ["All","Rice","Husk","Polish"], key="sa_prod2")
-    sdf = df_read("""SELECT s.id, s.dt, s.product, g.grade_name, s.final_qtl, s.rate_qtl, s.revenue, s.notes
+    sdf = df_read("""SELECT s.id, date(s.dt) AS Date, s.product, g.grade_name, s.final_qtl, s.rate_qtl, s.revenue, s.notes
                      FROM sales s LEFT JOIN rice_grades g ON s.grade_id=g.grade_id
-                     ORDER BY s.id DESC""")
-    sdf["Date"] = sdf["dt"].apply(lambda s: to_date(s))
-    sdf = sdf[(sdf["Date"]>=dfrom) & (sdf["Date"]<=dto)]
-    if prod!="All":
-        sdf = sdf[sdf["product"]==prod]
-    st.dataframe(sdf.drop(columns=["dt"]), use_container_width=True, height=280)
+                     WHERE s.dt BETWEEN ? AND ? AND (?='All' OR s.product=?)
+                     ORDER BY s.id DESC""",
+                  (dfrom.isoformat(), dto.isoformat(), prod, prod))
+    st.dataframe(sdf, use_container_width=True, height=280)
 
     st.markdown("**Add New**")
-    grade_list4 = df_read("SELECT grade_id, grade_name, default_price_qtl FROM rice_grades ORDER BY grade_name")
+    grade_list4 = df_read_cached("SELECT grade_id, grade_name, default_price_qtl FROM rice_grades ORDER BY grade_name")
+    _gname = dict(zip(grade_list4["grade_id"], grade_list4["grade_name"]))
+    _price = dict(zip(grade_list4["grade_id"], grade_list4["default_price_qtl"].fillna(0.0)))
     a1, a2, a3 = cols(3)
     sa_dt = a1.date_input("Date", value=date.today(), key="sa_add_dt2")
     sa_prod = a2.selectbox("Product", ["Rice","Husk","Polish"], key="sa_add_prod2")
     sa_gid = a3.selectbox("Grade (if Rice)", options=[""] + grade_list4["grade_id"].tolist(), index=0,
-                             format_func=lambda x: (grade_list4.set_index("grade_id").loc[x,"grade_name"] if x else ""), key="sa_add_gid2")
+                             format_func=lambda x: _gname.get(x, ""), key="sa_add_gid2")
     b1, b2, b3 = cols(3)
     sa_qty = b1.number_input("Qty (qtl)", min_value=0.0, step=0.1, key="sa_add_qty2")
-    # default price
-    def_rate = 0.0
-    try:
-        if sa_prod == "Rice" and sa_gid:
-            def_rate = float(grade_list4.set_index("grade_id").loc[sa_gid,"default_price_qtl"] or 0.0)
-    except Exception:
-        def_rate = 0.0
-    sa_rate = b2.number_input("Rate (₹/qtl)", min_value=0.0, step=50.0, value=def_rate, key="sa_add_rate2")
+    # default price; a keyed number_input ignores a changed value=, so re-seed its state
+    # whenever the product/grade pair changes
+    def_rate = float(_price.get(sa_gid, 0.0)) if (sa_prod == "Rice" and sa_gid) else 0.0
+    if st.session_state.get("sa_add_rate2_for") != (sa_prod, sa_gid):
+        st.session_state["sa_add_rate2"] = def_rate
+        st.session_state["sa_add_rate2_for"] = (sa_prod, sa_gid)
+    sa_rate = b2.number_input("Rate (₹/qtl)", min_value=0.0, step=50.0, key="sa_add_rate2")
     sa_notes = b3.text_input("Notes", key="sa_add_notes2")
     if st.button("Add Sale", key="sa_add_btn2"):
         revenue = sa_qty * sa_rate if (sa_qty and sa_rate) else 0.0
@@ -350,9 +451,9 @@ with tab_sales:
     st.markdown("---")
     if not sdf.empty:
         row_id = st.selectbox("Select Sale ID", sdf["id"], key="sa_row2")
-        row = sdf[sdf["id"]==row_id].iloc[0]
+        row = df_read("SELECT * FROM sales WHERE id=?", (int(row_id),)).iloc[0]
         e1, e2, e3 = cols(3)
-        qty = e1.number_input("Qty (qtl)", value=float(row["final_qtl"]), step=0.1, key="sa_edit_qty2")
+        qty = e1.number_input("Qty (qtl)", value=float(row["final_qtl"] or 0), step=0.1, key="sa_edit_qty2")
         rate = e2.number_input("Rate (₹/qtl)", value=float(row["rate_qtl"] or 0), step=50.0, key="sa_edit_rate2")
         notes = e3.text_input("Notes", value=row["notes"] or "", key="sa_edit_notes2")
         if st.button("Save Changes", key="sa_save2"):
@@ -364,55 +465,86 @@ with tab_sales:
             exec_sql("DELETE FROM sales WHERE id=?", (int(row_id),))
             st.warning("Deleted"); st.rerun()
 
+with tab_sales:
+    render_sales()
+
 # ----- Stock Ledger -----
-with tab_stock:
+@st.fragment
+def render_stock():
     st.subheader("📒 Stock Ledger")
-    paddy_in = df_read("SELECT paddy_id, COALESCE(SUM(final_qtl),0) AS in_qtl FROM purchases GROUP BY paddy_id")
-    paddy_used = df_read("SELECT paddy_id, COALESCE(SUM(final_used_qtl),0) AS used_qtl FROM milling_input GROUP BY paddy_id")
-    paddy_bal = pd.merge(paddy_in, paddy_used, on="paddy_id", how="outer").fillna(0)
-    paddy_bal["Closing_qtl"] = paddy_bal["in_qtl"] - paddy_bal["used_qtl"]
-    names = df_read("SELECT paddy_id, paddy_name FROM paddy_types")
-    paddy_bal = paddy_bal.merge(names, on="paddy_id", how="left")
-    paddy_bal = paddy_bal[["paddy_name","in_qtl","used_qtl","Closing_qtl"]].rename(columns={"paddy_name":"Paddy"})
+    # Ids come from the masters and the transactions; NULL or deleted ids land in "(unknown)"
+    paddy_bal = rows_read_cached("""
+        WITH ids AS (SELECT paddy_id FROM paddy_types UNION SELECT paddy_id FROM purchases
+                     UNION SELECT paddy_id FROM milling_input),
+             inq AS (SELECT paddy_id, SUM(final_qtl) s FROM purchases GROUP BY paddy_id),
+             usd AS (SELECT paddy_id, SUM(final_used_qtl) s FROM milling_input GROUP BY paddy_id)
+        SELECT COALESCE(pt.paddy_name,'(unknown)') AS Paddy,
+               SUM(COALESCE(inq.s,0)) AS in_qtl,
+               SUM(COALESCE(usd.s,0)) AS used_qtl,
+               SUM(COALESCE(inq.s,0)-COALESCE(usd.s,0)) AS Closing_qtl
+        FROM ids LEFT JOIN paddy_types pt ON pt.paddy_id = ids.paddy_id
+                 LEFT JOIN inq ON inq.paddy_id IS ids.paddy_id
+                 LEFT JOIN usd ON usd.paddy_id IS ids.paddy_id
+        GROUP BY Paddy
+        ORDER BY Paddy='(unknown)', Paddy""")
     st.markdown("**Paddy Stock (qtl)**")
     st.dataframe(paddy_bal, use_container_width=True)
 
-    out = df_read("SELECT grade_id, COALESCE(SUM(final_out_qtl),0) AS out_qtl FROM milling_output GROUP BY grade_id")
-    sold = df_read("SELECT grade_id, COALESCE(SUM(final_qtl),0) AS sold_qtl FROM sales WHERE product='Rice' GROUP BY grade_id")
-    grade_bal = pd.merge(out, sold, on="grade_id", how="outer").fillna(0)
-    grade_bal["Closing_qtl"] = grade_bal["out_qtl"] - grade_bal["sold_qtl"]
-    gnames = df_read("SELECT grade_id, grade_name FROM rice_grades")
-    grade_bal = grade_bal.merge(gnames, on="grade_id", how="left")
-    grade_bal = grade_bal[["grade_name","out_qtl","sold_qtl","Closing_qtl"]].rename(columns={"grade_name":"Grade"})
+    grade_bal = rows_read_cached("""
+        WITH ids AS (SELECT grade_id FROM rice_grades UNION SELECT grade_id FROM milling_output
+                     UNION SELECT grade_id FROM sales WHERE product='Rice'),
+             o AS (SELECT grade_id, SUM(final_out_qtl) s FROM milling_output GROUP BY grade_id),
+             sd AS (SELECT grade_id, SUM(final_qtl) s FROM sales WHERE product='Rice' GROUP BY grade_id)
+        SELECT COALESCE(g.grade_name,'(unknown)') AS Grade,
+               SUM(COALESCE(o.s,0)) AS out_qtl,
+               SUM(COALESCE(sd.s,0)) AS sold_qtl,
+               SUM(COALESCE(o.s,0)-COALESCE(sd.s,0)) AS Closing_qtl
+        FROM ids LEFT JOIN rice_grades g ON g.grade_id = ids.grade_id
+                 LEFT JOIN o ON o.grade_id IS ids.grade_id
+                 LEFT JOIN sd ON sd.grade_id IS ids.grade_id
+        GROUP BY Grade
+        ORDER BY Grade='(unknown)', Grade""")
     st.markdown("**Rice Grade Stock (qtl)**")
     st.dataframe(grade_bal, use_container_width=True)
 
+with tab_stock:
+    render_stock()
+
 # ----- Yield % Report -----
-with tab_yield:
+@st.fragment
+def render_yield():
     st.subheader("📊 Yield % Report")
-    out_by_paddy = df_read("SELECT paddy_id, COALESCE(SUM(final_out_qtl),0) AS rice_out_qtl FROM milling_output GROUP BY paddy_id")
-    used_by_paddy = df_read("SELECT paddy_id, COALESCE(SUM(final_used_qtl),0) AS paddy_used_qtl FROM milling_input GROUP BY paddy_id")
-    y = pd.merge(used_by_paddy, out_by_paddy, on="paddy_id", how="outer").fillna(0)
-    names = df_read("SELECT paddy_id, paddy_name FROM paddy_types")
-    y = y.merge(names, on="paddy_id", how="left")
-    y["rice_out_qtl"] = pd.to_numeric(y["rice_out_qtl"], errors="coerce")
-    y["paddy_used_qtl"] = pd.to_numeric(y["paddy_used_qtl"], errors="coerce")
-    y["Yield_%"] = (y["rice_out_qtl"] * 100.0 / y["paddy_used_qtl"].replace({0: pd.NA})).round(2)
-    y = y[["paddy_name","paddy_used_qtl","rice_out_qtl","Yield_%"]].rename(columns={"paddy_name":"Paddy","paddy_used_qtl":"Paddy Used (qtl)","rice_out_qtl":"Rice Out (qtl)"})
+    y = rows_read_cached("""
+        WITH ids AS (SELECT paddy_id FROM milling_input UNION SELECT paddy_id FROM milling_output),
+             usd AS (SELECT paddy_id, SUM(final_used_qtl) s FROM milling_input GROUP BY paddy_id),
+             o AS (SELECT paddy_id, SUM(final_out_qtl) s FROM milling_output GROUP BY paddy_id)
+        SELECT COALESCE(pt.paddy_name,'(unknown)') AS Paddy,
+               SUM(COALESCE(usd.s,0)) AS "Paddy Used (qtl)",
+               SUM(COALESCE(o.s,0)) AS "Rice Out (qtl)",
+               CASE WHEN SUM(COALESCE(usd.s,0))=0 THEN NULL
+                    ELSE ROUND(100.0*SUM(COALESCE(o.s,0))/SUM(usd.s), 2) END AS "Yield_%"
+        FROM ids LEFT JOIN paddy_types pt ON pt.paddy_id = ids.paddy_id
+                 LEFT JOIN usd ON usd.paddy_id IS ids.paddy_id
+                 LEFT JOIN o ON o.paddy_id IS ids.paddy_id
+        GROUP BY Paddy
+        ORDER BY Paddy='(unknown)', Paddy""")
     st.markdown("**Overall Yield by Paddy Type**")
     st.dataframe(y, use_container_width=True)
 
-    mi_df = df_read("SELECT dt, final_used_qtl FROM milling_input").copy()
-    mo_df = df_read("SELECT dt, final_out_qtl FROM milling_output").copy()
-    mi_df["dt"] = pd.to_datetime(mi_df["dt"], errors="coerce").dt.date
-    mi_df["final_used_qtl"] = pd.to_numeric(mi_df["final_used_qtl"], errors="coerce")
-    mo_df["dt"] = pd.to_datetime(mo_df["dt"], errors="coerce").dt.date
-    mo_df["final_out_qtl"] = pd.to_numeric(mo_df["final_out_qtl"], errors="coerce")
-    mi_g = mi_df.groupby("dt", dropna=True)["final_used_qtl"].sum().rename("Paddy_Used_qtl")
-    mo_g = mo_df.groupby("dt", dropna=True)["final_out_qtl"].sum().rename("Rice_Out_qtl")
-    dy = pd.concat([mi_g, mo_g], axis=1).fillna(0.0).reset_index().rename(columns={"dt":"Date"})
-    if not dy.empty:
-        dy["Yield_%"] = (dy["Rice_Out_qtl"] * 100.0 / dy["Paddy_Used_qtl"].replace({0: pd.NA})).round(2)
-        dy = dy.sort_values("Date", ascending=False)
+    # Daily totals from one UNION ALL pass; both sides use the dt indexes
+    dy = df_read_cached("""
+        SELECT dt AS Date,
+               SUM(CASE WHEN src='mi' THEN used ELSE 0 END) AS Paddy_Used_qtl,
+               SUM(CASE WHEN src='mo' THEN out ELSE 0 END) AS Rice_Out_qtl
+        FROM (SELECT dt, COALESCE(final_used_qtl,0) used, 0 out, 'mi' src FROM milling_input
+              WHERE dt IS NOT NULL AND dt <> ''
+              UNION ALL
+              SELECT dt, 0, COALESCE(final_out_qtl,0), 'mo' FROM milling_output
+              WHERE dt IS NOT NULL AND dt <> '')
+        GROUP BY dt ORDER BY dt DESC""")
+    dy["Yield_%"] = (dy["Rice_Out_qtl"] * 100.0 / dy["Paddy_Used_qtl"].where(dy["Paddy_Used_qtl"] != 0)).round(2)
     st.markdown("**Daily Yield (All Paddies)**")
     st.dataframe(dy, use_container_width=True, height=280)
+
+with tab_yield:
+    render_yield()